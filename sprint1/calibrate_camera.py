@@ -2,141 +2,273 @@ import numpy as np
 import cv2
 import glob
 import pickle
+import time
 
 
 import os
-import glob
-
-# 1. Check where we are running
-current_dir = os.getcwd()
-print(f"Current Working Directory: {current_dir}")
-
-# 2. Check if folder exists
-folder_path = os.path.join(current_dir, 'calibration_images')
-if os.path.exists(folder_path):
-    print(f"Folder 'calibration_images' FOUND at: {folder_path}")
-    
-    # 3. Check for contents
-    files = os.listdir(folder_path)
-    print(f"   Contents: {files[:5]} ... (showing first 5)")
-    
-    # 4. Check specifically for .jpg
-    jpgs = glob.glob('calibration_images/*.jpg')
-    print(f"   .jpg files found by glob: {len(jpgs)}")
-    
-    if len(jpgs) == 0:
-        print("ERROR: Folder exists but contains no '.jpg' files.")
-        print("   -> Check if your files are .jpeg, .png, or have capital .JPG extensions.")
-else:
-    print(f"ERROR: Folder 'calibration_images' NOT FOUND in {current_dir}")
-    print("   -> Did you create the folder? Is the name exact?")
 
 # --- CONFIGURATION ---
 # Define the number of INNER corners in your checkerboard
 # (e.g., if the board is 8x6 squares, the inner corners are 7x5)
-CHECKERBOARD_DIMS = (9, 6) 
+CHECKERBOARD_DIMS = (9, 6)
 
 # Size of one square in real units (e.g., 30mm or 3cm)
 # This is less critical for undistortion, but good practice.
-SQUARE_SIZE = 30 
+SQUARE_SIZE = 30
+
+# Detection mode:
+#   "coarse_to_fine" - decode a reduced copy, search it, then refine the
+#                      corners on the full-resolution image only
+#   "full"           - search the full-resolution image (original behaviour)
+DETECTION_MODE = "coarse_to_fine"
+
+# JPEG decode reduction for the coarse search (2, 4 or 8)
+COARSE_FACTOR = 4
+
+# Fall back to the sector-based detector (findChessboardCornersSB) on the
+# reduced copy when the classic detector fails
+USE_SECTOR_DETECTOR = True
+
+# Drop images whose RMS reprojection error is above
+# max(OUTLIER_MIN_PX, OUTLIER_FACTOR * median) and recalibrate once
+OUTLIER_FACTOR = 2.0
+OUTLIER_MIN_PX = 0.5
+MIN_IMAGES = 5
+
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def check_calibration_folder():
+    # 1. Check where we are running
+    current_dir = os.getcwd()
+    print(f"Current Working Directory: {current_dir}")
+
+    # 2. Check if folder exists
+    folder_path = os.path.join(current_dir, 'calibration_images')
+    if os.path.exists(folder_path):
+        print(f"Folder 'calibration_images' FOUND at: {folder_path}")
+
+        # 3. Check for contents
+        files = os.listdir(folder_path)
+        print(f"   Contents: {files[:5]} ... (showing first 5)")
+
+        # 4. Check specifically for .jpg
+        jpgs = glob.glob('calibration_images/*.jpg')
+        print(f"   .jpg files found by glob: {len(jpgs)}")
+
+        if len(jpgs) == 0:
+            print("ERROR: Folder exists but contains no '.jpg' files.")
+            print("   -> Check if your files are .jpeg, .png, or have capital .JPG extensions.")
+    else:
+        print(f"ERROR: Folder 'calibration_images' NOT FOUND in {current_dir}")
+        print("   -> Did you create the folder? Is the name exact?")
+
+
+def board_object_points(dims=CHECKERBOARD_DIMS, square_size=SQUARE_SIZE):
+    # Prepare object points, like (0,0,0), (1,0,0), (2,0,0) ....,(6,5,0)
+    # This defines the "ideal" flat board structure.
+    objp = np.zeros((dims[0] * dims[1], 3), np.float32)
+    objp[:, :2] = np.mgrid[0:dims[0], 0:dims[1]].T.reshape(-1, 2)
+    return objp * square_size
+
+
+def find_corners_full(gray, dims=CHECKERBOARD_DIMS):
+    """Original detection: search and refine on the full-resolution image."""
+    # ret is a boolean: True if corners are found
+    ret, corners = cv2.findChessboardCorners(gray, dims, None)
+    if not ret:
+        return None
+    # Increases accuracy by finding sub-pixel corner locations
+    return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), SUBPIX_CRITERIA)
+
 
-# Arrays to store object points and image points from all the images.
-objpoints = [] # 3d point in real world space
-imgpoints = [] # 2d points in image plane.
+def find_corners_coarse(small, dims=CHECKERBOARD_DIMS, use_sector=USE_SECTOR_DETECTOR):
+    """Search a reduced image; returns corners in reduced-image pixels or None."""
+    flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_FAST_CHECK
+    ret, corners = cv2.findChessboardCorners(small, dims, flags)
+    if ret:
+        return corners
+    if use_sector:
+        ret, corners = cv2.findChessboardCornersSB(small, dims, cv2.CALIB_CB_NORMALIZE_IMAGE)
+        if ret:
+            return corners.reshape(-1, 1, 2)
+    return None
 
-# Prepare object points, like (0,0,0), (1,0,0), (2,0,0) ....,(6,5,0)
-# This defines the "ideal" flat board structure.
-objp = np.zeros((CHECKERBOARD_DIMS[0] * CHECKERBOARD_DIMS[1], 3), np.float32)
-objp[:, :2] = np.mgrid[0:CHECKERBOARD_DIMS[0], 0:CHECKERBOARD_DIMS[1]].T.reshape(-1, 2)
-objp = objp * SQUARE_SIZE
 
-# Load images
-images = glob.glob('calibration_images/*.jpg') # Ensure format matches your phone's output
+def refine_corners(gray, coarse_corners, factor):
+    """Scale coarse corners up to full resolution and refine them there."""
+    corners = (coarse_corners.astype(np.float32) + 0.5) * factor - 0.5
+    # The search window must cover the coarse localisation error (~factor px)
+    half = max(11, 2 * factor + 1)
+    return cv2.cornerSubPix(gray, corners, (half, half), (-1, -1), SUBPIX_CRITERIA)
 
-print(f"Found {len(images)} images. Starting processing...")
 
-for fname in images:
+def detect_image(fname, mode=DETECTION_MODE, factor=COARSE_FACTOR, dims=CHECKERBOARD_DIMS):
+    """Return (corners, image_size) for one photo; corners is None if not found."""
+    if mode == "coarse_to_fine":
+        small = cv2.imread(fname, REDUCED_FLAGS[factor])
+        if small is None:
+            return None, None
+        coarse = find_corners_coarse(small, dims)
+        if coarse is None:
+            return None, (small.shape[1] * factor, small.shape[0] * factor)
+        # Only decode at full resolution once a board has been found
+        gray = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
+        return refine_corners(gray, coarse, factor), gray.shape[::-1]
+
     img = cv2.imread(fname)
+    if img is None:
+        return None, None
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return find_corners_full(gray, dims), gray.shape[::-1]
 
-    # Find the chess board corners
-    # ret is a boolean: True if corners are found
-    ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD_DIMS, None)
-
-    # If found, add object points, image points (after refining them)
-    if ret == True:
-        print(f"Corners found in {fname}")
-        objpoints.append(objp)
-        
-        # Increases accuracy by finding sub-pixel corner locations
-        corners2 = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), 
-                                    (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001))
-        imgpoints.append(corners2)
-        
-        # Optional: Draw and display the corners to verify
-        # cv2.drawChessboardCorners(img, CHECKERBOARD_DIMS, corners2, ret)
-        # cv2.imshow('img', img)
-        # cv2.waitKey(500)
-    else:
-        print(f"Warning: Could not find corners in {fname}")
 
-cv2.destroyAllWindows()
+def per_image_errors(objpoints, imgpoints, mtx, dist, rvecs, tvecs):
+    """RMS reprojection error (px) of each image."""
+    errors = []
+    for objp, imgp, rvec, tvec in zip(objpoints, imgpoints, rvecs, tvecs):
+        projected, _ = cv2.projectPoints(objp, rvec, tvec, mtx, dist)
+        diff = projected.reshape(-1, 2) - imgp.reshape(-1, 2)
+        errors.append(float(np.sqrt(np.mean(np.sum(diff ** 2, axis=1)))))
+    return errors
 
-# --- CALIBRATION ---
-print("Calibrating camera... (this may take a moment)")
-ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, gray.shape[::-1], None, None)
 
-# --- OUTPUT RESULTS ---
-print("\n calibration successful!")
-print("\nCamera Matrix (K):\n", mtx)
-print("\nDistortion Coefficients (D):\n", dist)
+def calibrate_with_outlier_rejection(objpoints, imgpoints, names, image_size):
+    """
+    Calibrate, drop images whose reprojection error is an outlier, recalibrate.
 
-# --- SAVE DATA FOR SPRINT 1 USE ---
-# You need these values for the next step (Warp Perspective)
-data = {
-    "camera_matrix": mtx,
-    "dist_coeff": dist
-}
+    Outliers are judged once against the first calibration; repeating the test
+    would keep lowering the median and eat into good images.
+    Returns (ret, mtx, dist, kept_names, errors) for the final calibration.
+    """
+    names = list(names)
+    ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, image_size, None, None)
+    errors = per_image_errors(objpoints, imgpoints, mtx, dist, rvecs, tvecs)
+
+    limit = max(OUTLIER_MIN_PX, OUTLIER_FACTOR * float(np.median(errors)))
+    keep = [i for i, e in enumerate(errors) if e <= limit]
+    if len(keep) == len(errors) or len(keep) < MIN_IMAGES:
+        return ret, mtx, dist, names, errors
+
+    for i, e in enumerate(errors):
+        if e > limit:
+            print(f"   Dropping outlier {names[i]} (error {e:.3f} px > {limit:.3f} px)")
+    objpoints = [objpoints[i] for i in keep]
+    imgpoints = [imgpoints[i] for i in keep]
+    names = [names[i] for i in keep]
+
+    ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, image_size, None, None)
+    errors = per_image_errors(objpoints, imgpoints, mtx, dist, rvecs, tvecs)
+    return ret, mtx, dist, names, errors
+
+
+def main():
+    check_calibration_folder()
+
+    # Arrays to store object points and image points from all the images.
+    objpoints = [] # 3d point in real world space
+    imgpoints = [] # 2d points in image plane.
+    found_names = []
+    image_size = None
 
-with open("camera_calibration.pkl", "wb") as f:
-    pickle.dump(data, f)
+    objp = board_object_points()
 
-print("\nCalibration data saved to 'camera_calibration.pkl'")
+    # Load images
+    images = glob.glob('calibration_images/*.jpg') # Ensure format matches your phone's output
 
+    print(f"Found {len(images)} images. Starting processing (mode: {DETECTION_MODE})...")
 
+    detect_start = time.time()
+    for fname in images:
+        t0 = time.time()
+        corners2, size = detect_image(fname)
+        elapsed_ms = (time.time() - t0) * 1000
 
+        # If found, add object points, image points (after refining them)
+        if corners2 is not None:
+            print(f"Corners found in {fname} ({elapsed_ms:.0f} ms)")
+            objpoints.append(objp)
+            imgpoints.append(corners2)
+            found_names.append(fname)
+            image_size = size
+        else:
+            print(f"Warning: Could not find corners in {fname} ({elapsed_ms:.0f} ms)")
 
-# --- VERIFICATION BLOCK ---
+    detect_total = time.time() - detect_start
+    if images:
+        print(f"Detection took {detect_total:.2f} s ({detect_total / len(images) * 1000:.0f} ms per photo).")
 
-# 1. VISUALIZE DETECTED CORNERS
-# Take the last processed image
-img_with_corners = cv2.imread(images[0])
-gray_corners = cv2.cvtColor(img_with_corners, cv2.COLOR_BGR2GRAY)
-ret, corners = cv2.findChessboardCorners(gray_corners, CHECKERBOARD_DIMS, None)
+    if len(objpoints) == 0:
+        print("ERROR: No checkerboards detected; cannot calibrate.")
+        return
 
-if ret:
-    cv2.drawChessboardCorners(img_with_corners, CHECKERBOARD_DIMS, corners, ret)
+    # --- CALIBRATION ---
+    print("Calibrating camera... (this may take a moment)")
+    ret, mtx, dist, kept_names, errors = calibrate_with_outlier_rejection(
+        objpoints, imgpoints, found_names, image_size
+    )
+
+    # --- OUTPUT RESULTS ---
+    print("\n calibration successful!")
+    print(f"\nRMS reprojection error: {ret:.3f} px ({len(kept_names)} images)")
+    for fname, err in zip(kept_names, errors):
+        print(f"   {fname}: {err:.3f} px")
+    print("\nCamera Matrix (K):\n", mtx)
+    print("\nDistortion Coefficients (D):\n", dist)
+
+    # --- SAVE DATA FOR SPRINT 1 USE ---
+    # You need these values for the next step (Warp Perspective)
+    data = {
+        "camera_matrix": mtx,
+        "dist_coeff": dist,
+        "image_size": image_size,
+    }
+
+    with open("camera_calibration.pkl", "wb") as f:
+        pickle.dump(data, f)
+
+    print("\nCalibration data saved to 'camera_calibration.pkl'")
+
+
+
+
+    # --- VERIFICATION BLOCK ---
+    # Both checks use the first calibrated image, read once, with the corners
+    # already found above (no second detection pass).
+    first_name = kept_names[0]
+    raw_img = cv2.imread(first_name)
+
+    # 1. VISUALIZE DETECTED CORNERS
+    img_with_corners = raw_img.copy()
+    cv2.drawChessboardCorners(img_with_corners, CHECKERBOARD_DIMS, imgpoints[found_names.index(first_name)], True)
     cv2.imwrite('verification_1_corners_found.jpg', img_with_corners)
     print("\n[Check 1] Saved 'verification_1_corners_found.jpg'. Open this to see if corners are mapped correctly.")
 
-# 2. VISUALIZE UNDISTORTION (The "Straight Lines" Check)
-# We will take a raw image and apply the calibration matrix to it.
-raw_img = cv2.imread(images[0])
-h,  w = raw_img.shape[:2]
+    # 2. VISUALIZE UNDISTORTION (The "Straight Lines" Check)
+    # We will take a raw image and apply the calibration matrix to it.
+    h,  w = raw_img.shape[:2]
+
+    # Get the optimal new camera matrix (removes black edges if necessary)
+    newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w,h), 1, (w,h))
 
-# Get the optimal new camera matrix (removes black edges if necessary)
-newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w,h), 1, (w,h))
+    # Undistort
+    undistorted_img = cv2.undistort(raw_img, mtx, dist, None, newcameramtx)
 
-# Undistort
-undistorted_img = cv2.undistort(raw_img, mtx, dist, None, newcameramtx)
+    # Crop the image (optional, if the undistortion adds black borders)
+    # x, y, w, h = roi
+    # undistorted_img = undistorted_img[y:y+h, x:x+w]
 
-# Crop the image (optional, if the undistortion adds black borders)
-# x, y, w, h = roi
-# undistorted_img = undistorted_img[y:y+h, x:x+w]
+    # Save the comparison
+    cv2.imwrite('verification_2_undistorted.jpg', undistorted_img)
+    print("[Check 2] Saved 'verification_2_undistorted.jpg'. Compare this with the original.")
+    print("   - Look at the edges of the checkerboard or straight lines in the background.")
+    print("   - In the undistorted image, they should be perfectly straight, not bowed.")
 
-# Save the comparison
-cv2.imwrite('verification_2_undistorted.jpg', undistorted_img)
-print("[Check 2] Saved 'verification_2_undistorted.jpg'. Compare this with the original.")
-print("   - Look at the edges of the checkerboard or straight lines in the background.")
-print("   - In the undistorted image, they should be perfectly straight, not bowed.")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Automatic canvas sizing: project the usable part of the video frame through
+the homography, clip it at a maximum range from the camera, and return the
+tightest canvas size and shift that contain the road footprint.
+
+Replaces the hand-tuned CANVAS_SIZE / MAP_W / SHIFT_X constants in the video
+scripts when their AUTO_CANVAS switch is on. A canvas over the pixel budget
+keeps its range and is rendered at a lower resolution (layout "scale" and
+"pixels_per_cm"); layout_homography() includes that scale.
+"""
+
+import os
+import cv2
+import numpy as np
+
+import geometry
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+VIDEO_PATH = "road_test.mp4"
+PIPELINE_PATH = geometry.PIPELINE_PATH
+
+# Ignore ground further than this from the camera foot point
+MAX_RANGE_CM = 800
+
+# Ignore ground further than this to either side of the camera (map X axis,
+# which follows the checkerboard rows). None = no lateral limit.
+MAX_HALF_WIDTH_CM = 200
+
+# Upper bound on canvas area (None = unlimited); resolution is reduced to fit
+MAX_CANVAS_PIXELS = 2000 * 2000
+
+# Part of the undistorted frame that shows usable road (fractions, like the
+# crop bounds in calculate_homography.py). Lower USABLE_H_MAX to drop the bonnet.
+USABLE_W_MIN = 0.0
+USABLE_W_MAX = 1.0
+USABLE_H_MIN = 0.0
+USABLE_H_MAX = 1.0
+
+# Spacing of the pixel grid used to trace the footprint, and border around it
+SAMPLE_STEP = 4
+MARGIN_PX = 20
+
+
+def ground_footprint(data, frame_size, max_range_cm, max_half_width_cm=MAX_HALF_WIDTH_CM,
+                     sample_step=SAMPLE_STEP,
+                     usable=(USABLE_W_MIN, USABLE_W_MAX, USABLE_H_MIN, USABLE_H_MAX)):
+    """
+    Map-pixel coordinates (N x 2) of usable frame pixels within range.
+
+    The grid is laid over the raw frame and undistorted point-wise, so the black
+    border that cv2.undistort leaves around the image is not counted.
+    """
+    w, h = frame_size
+    H = data["homography_matrix"]
+    pose = geometry.camera_ground_pose(data["camera_matrix"], H, frame_size)
+
+    w_min, w_max, h_min, h_max = usable
+    xs = np.arange(int(w * w_min), int(w * w_max), sample_step, dtype=np.float64)
+    ys = np.arange(int(h * h_min), int(h * h_max), sample_step, dtype=np.float64)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    raw = np.column_stack([grid_x.ravel(), grid_y.ravel()]).reshape(-1, 1, 2)
+    pts = cv2.undistortPoints(raw, data["camera_matrix"], data["dist_coeff"],
+                              P=data["camera_matrix"]).reshape(-1, 2)
+
+    ground, hw = geometry.pixels_to_ground(H, pts)
+    on_ground = np.sign(hw) == geometry.ground_sign(H, frame_size)
+    rng = np.hypot(ground[:, 0] - pose["foot_cm"][0],
+                   ground[:, 1] - pose["foot_cm"][1])
+    keep = on_ground & (rng <= max_range_cm)
+    if max_half_width_cm is not None:
+        keep &= np.abs(ground[:, 0] - pose["foot_cm"][0]) <= max_half_width_cm
+    return ground[keep] * geometry.PIXELS_PER_CM
+
+
+def fit_to_budget(x_min, y_min, x_max, y_max, max_pixels, margin_px=MARGIN_PX):
+    """
+    Layout for a footprint bounding box (map pixels), scaled down to max_pixels.
+
+    The shift is in full-resolution map pixels; the scale is applied after it.
+    """
+    full_w = x_max - x_min + 2 * margin_px
+    full_h = y_max - y_min + 2 * margin_px
+    scale = 1.0
+    if max_pixels is not None and full_w * full_h > max_pixels:
+        scale = float(np.sqrt(max_pixels / (full_w * full_h)))
+    return {
+        "width": max(int(full_w * scale), 1),
+        "height": max(int(full_h * scale), 1),
+        "shift_x": int(margin_px - x_min),
+        "shift_y": int(margin_px - y_min),
+        "scale": scale,
+        "pixels_per_cm": geometry.PIXELS_PER_CM * scale,
+    }
+
+
+def compute_canvas_layout(data, frame_size, max_range_cm=MAX_RANGE_CM,
+                          max_pixels=MAX_CANVAS_PIXELS, margin_px=MARGIN_PX,
+                          max_half_width_cm=MAX_HALF_WIDTH_CM, sample_step=SAMPLE_STEP):
+    """
+    Return {"width", "height", "shift_x", "shift_y", "scale", "pixels_per_cm",
+    "max_range_cm"}.
+
+    The shift is the translation applied on top of the homography so the
+    footprint starts at (margin_px, margin_px). If the canvas exceeds
+    max_pixels, the whole footprint is kept and the canvas is scaled down by
+    "scale" (pixels_per_cm drops below geometry.PIXELS_PER_CM).
+    """
+    footprint = ground_footprint(data, frame_size, max_range_cm, max_half_width_cm, sample_step)
+    if len(footprint) == 0:
+        raise ValueError(f"No ground visible within {max_range_cm:.0f} cm of the camera.")
+
+    x_min, y_min = np.floor(footprint.min(axis=0))
+    x_max, y_max = np.ceil(footprint.max(axis=0))
+    layout = fit_to_budget(x_min, y_min, x_max, y_max, max_pixels, margin_px)
+    layout["max_range_cm"] = float(max_range_cm)
+    if layout["scale"] < 1.0:
+        print(f"   Canvas over budget ({max_pixels / 1e6:.1f} Mpx): rendering at "
+              f"{layout['pixels_per_cm']:.2f} px/cm instead of {geometry.PIXELS_PER_CM}.")
+    return layout
+
+
+def layout_homography(data, layout):
+    """Final warp matrix (translation, homography, then the layout scale)."""
+    shift = geometry.translation_matrix(layout["shift_x"], layout["shift_y"])
+    return geometry.scaled_homography(shift @ data["homography_matrix"], layout.get("scale", 1.0))
+
+
+def main():
+    if not os.path.isfile(PIPELINE_PATH):
+        print(f"Error: '{PIPELINE_PATH}' not found.")
+        return
+
+    data = geometry.load_pipeline(PIPELINE_PATH)
+    frame_size = geometry.video_frame_size(VIDEO_PATH)
+    layout = compute_canvas_layout(data, frame_size)
+
+    print(f"Footprint within {layout['max_range_cm']:.0f} cm of the camera:")
+    print(f"   Canvas: {layout['width']}x{layout['height']} "
+          f"({layout['width'] * layout['height'] / 1e6:.2f} Mpx)")
+    print(f"   Shift:  SHIFT_X={layout['shift_x']}, SHIFT_Y={layout['shift_y']}")
+    print(f"   Scale:  {layout['pixels_per_cm']:.2f} px/cm")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@ import numpy as np
 import pickle
 import sys
 
+import canvas_layout
+import frame_buffers
+import geometry
+
 # --- CONFIGURATION ---
 VIDEO_PATH = 'road_test.mp4'
 OUTPUT_FILENAME = 'sprint1_demo_reel.mp4'
@@ -13,6 +17,8 @@ OUTPUT_SCALE = 0.5
 MAP_W_REAL = 4000  # Actual math width
 MAP_H_REAL = 4000  # Actual math height
 SHIFT_X = 1500     # Adjust this to center your road (same as previous script)
+# Size the map from the projected road footprint instead (see canvas_layout.py)
+AUTO_CANVAS = True
 
 # 1. Load Pipeline
 try:
@@ -34,12 +40,22 @@ video_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 video_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
 # Create Translation Matrix for the Map
-Translation = np.array([
-    [1, 0, SHIFT_X],
-    [0, 1, 0],
-    [0, 0, 1]
-])
-H_final = np.matmul(Translation, H)
+if AUTO_CANVAS:
+    # Never larger than the hand-tuned canvas it replaces
+    layout = canvas_layout.compute_canvas_layout(data, (video_w, video_h), max_pixels=MAP_W_REAL * MAP_H_REAL)
+    MAP_W_REAL, MAP_H_REAL = layout["width"], layout["height"]
+    map_px_per_cm = layout["pixels_per_cm"]
+    H_final = canvas_layout.layout_homography(data, layout)
+    print(f"Auto canvas: {MAP_W_REAL}x{MAP_H_REAL} (range {layout['max_range_cm']:.0f} cm, "
+          f"{map_px_per_cm:.2f} px/cm)")
+else:
+    map_px_per_cm = 10
+    Translation = np.array([
+        [1, 0, SHIFT_X],
+        [0, 1, 0],
+        [0, 0, 1]
+    ])
+    H_final = np.matmul(Translation, H)
 
 # 3. Calculate Dimensions for the Side-by-Side
 # We want the Map to match the Video Height (e.g., 1080p)
@@ -62,47 +78,71 @@ print(f"Output Resolution: {output_w}x{output_h} (scale {OUTPUT_SCALE})")
 fourcc = cv2.VideoWriter_fourcc(*'mp4v')
 out = cv2.VideoWriter(OUTPUT_FILENAME, fourcc, fps, (output_w, output_h))
 
+# Preallocated buffers (see frame_buffers.py). The two views are slices of
+# the composite, so nothing has to be stacked per frame.
+pool = frame_buffers.BufferPool()
+frame_buf = pool.reserve("frame", (video_h, video_w, 3))
+combined = pool.reserve("combined", (total_h, total_w, 3))
+combined_small = pool.reserve("combined_small", (output_h, output_w, 3))
+preview = pool.reserve("preview", (int(total_h/2), int(total_w/2), 3))
+left_view = combined[:, :video_w]
+right_view = combined[:, video_w:]
+
+# Undistortion maps computed once (cv2.undistort rebuilds them every call)
+undist_map1, undist_map2 = cv2.initUndistortRectifyMap(mtx, dist, None, mtx, (video_w, video_h), cv2.CV_16SC2)
+
+# The map is rendered straight at its size in the composite (undistort, warp
+# and resize in one remap) instead of warping the full canvas and shrinking it
+view_scale_x = display_map_w / MAP_W_REAL
+view_scale = target_h / MAP_H_REAL
+H_view = geometry.scaled_homography(H_final, view_scale_x, view_scale)
+map_view1, map_view2, _ = geometry.build_birdseye_maps(data, H_view, (display_map_w, target_h), (video_w, video_h))
+
 print("Processing... Press 'q' to quit.")
 
+frame_count = 0
 while True:
-    ret, frame = cap.read()
+    ret, frame = cap.read(frame_buf)
     if not ret: break
+    pool.check("frame", frame)
 
     # A. The Left Image (Raw Video)
     # We can use the raw frame, or the undistorted one. Undistorted is more 'honest'.
-    left_view = cv2.undistort(frame, mtx, dist, None, mtx)
+    pool.check("combined", cv2.remap(frame, undist_map1, undist_map2, cv2.INTER_LINEAR, dst=left_view))
 
-    # B. The Right Image (The Map)
-    # 1. Warp to full high-res physics canvas first
-    warped_full = cv2.warpPerspective(left_view, H_final, (MAP_W_REAL, MAP_H_REAL))
-    
-    # 2. Add overlays to the high-res map
-    cv2.putText(warped_full, "10 px = 1 cm", (50, 80), 
-                cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 0, 255), 4)
-    cv2.line(warped_full, (50, 100), (150, 100), (0, 0, 255), 10)
+    # B. The Right Image (The Map), warped straight into the right half
+    pool.check("combined", cv2.remap(frame, map_view1, map_view2, cv2.INTER_LINEAR, dst=right_view))
 
-    # 3. Resize to match video height
-    right_view = cv2.resize(warped_full, (display_map_w, target_h))
+    # Overlays placed as they were on the full canvas: 10 cm reference line
+    cv2.putText(right_view, f"{map_px_per_cm:.3g} px = 1 cm", (int(50 * view_scale), int(80 * view_scale)),
+                cv2.FONT_HERSHEY_SIMPLEX, max(0.4, 2.0 * view_scale), (0, 0, 255), max(1, int(round(4 * view_scale))))
+    cv2.line(right_view, (int(50 * view_scale), int(100 * view_scale)),
+             (int((50 + 10 * map_px_per_cm) * view_scale), int(100 * view_scale)),
+             (0, 0, 255), max(1, int(round(10 * view_scale))))
 
-    # C. Stitch Them Together
-    # np.hstack stacks arrays horizontally
-    combined = np.hstack((left_view, right_view))
-
-    # D. Add Separator Line (Optional styling)
+    # C. Add Separator Line (Optional styling)
     cv2.line(combined, (video_w, 0), (video_w, total_h), (255, 255, 255), 4)
 
     # Save at scaled size for smaller file
-    combined_small = cv2.resize(combined, (output_w, output_h))
+    pool.check("combined_small", cv2.resize(combined, (output_w, output_h), dst=combined_small))
     out.write(combined_small)
     
     # Show a smaller preview on your screen
-    preview = cv2.resize(combined, (int(total_w/2), int(total_h/2)))
+    pool.check("preview", cv2.resize(combined, (int(total_w/2), int(total_h/2)), dst=preview))
     cv2.imshow('Sprint 1 Demo Reel', preview)
 
+    frame_count += 1
+    if frame_count == 1:
+        pool.mark_steady()
+    else:
+        pool.end_frame()
+
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
 cap.release()
 out.release()
 cv2.destroyAllWindows()
+pool.stop()
+print(pool.report())
 print(f"Saved Demo Reel to {OUTPUT_FILENAME}")
\ No newline at end of file
@@ -3,9 +3,21 @@ import numpy as np
 import pickle
 import sys
 
+import geometry
+from seekable_renderer import SeekableRenderer
+
 # --- CONFIGURATION ---
 VIDEO_PATH = 'road_test.mp4'  # Ensure this matches your file name
 
+# We use a large canvas to try and 'catch' the image if it's off-center
+MAP_W, MAP_H = 1500, 2000
+
+# Height of each half of the side-by-side view
+VIEW_H = 600
+
+# Rendered frames kept for scrubbing back and forth
+CACHE_FRAMES = 120
+
 # 1. Load Pipeline
 try:
     with open("geometry_pipeline_video.pkl", "rb") as f:
@@ -17,48 +29,112 @@ except FileNotFoundError:
     print("Error: Pipeline not found.")
     sys.exit()
 
-cap = cv2.VideoCapture(VIDEO_PATH)
-
-if not cap.isOpened():
+try:
+    renderer = SeekableRenderer(VIDEO_PATH, cache_frames=CACHE_FRAMES)
+except IOError:
     print(f"CRITICAL ERROR: Could not open '{VIDEO_PATH}'.")
     print("   -> Check the filename exactly.")
     print("   -> Try moving the video to the same folder as this script.")
     sys.exit()
 
+# Both halves are rendered straight at screen size (no full-size
+# intermediate); the maps are built once and each frame is two remaps
+frame_w, frame_h = renderer.frame_size
+view_w = int(VIEW_H * frame_w / frame_h)
+# Camera matrix of the resized view
+view_K = geometry.scaled_camera_matrix(mtx, view_w / frame_w, VIEW_H / frame_h)
+undistort_map1, undistort_map2 = cv2.initUndistortRectifyMap(
+    mtx, dist, None, view_K, (view_w, VIEW_H), cv2.CV_16SC2
+)
+H_view = geometry.scaled_homography(H, view_w / MAP_W, VIEW_H / MAP_H)
+warp_map1, warp_map2, _ = geometry.build_birdseye_maps(data, H_view, (view_w, VIEW_H), (frame_w, frame_h))
+
+
+def render_debug_view(frame, frame_index):
+    view = np.zeros((VIEW_H, 2 * view_w, 3), np.uint8)
+
+    # 1. Undistort (left half)
+    cv2.remap(frame, undistort_map1, undistort_map2, cv2.INTER_LINEAR, dst=view[:, :view_w])
+
+    # 2. Warp (right half)
+    warped = view[:, view_w:]
+    cv2.remap(frame, warp_map1, warp_map2, cv2.INTER_LINEAR, dst=warped)
+
+    # 3. DEBUG: Draw an 'X' on the warped image center to prove the window is working
+    cv2.line(warped, (0,0), (view_w, VIEW_H), (50, 50, 50), 1)
+    cv2.line(warped, (view_w, 0), (0, VIEW_H), (50, 50, 50), 1)
+
+    t = renderer.index["timestamps_ms"][frame_index] / 1000.0
+    cv2.putText(view, f"Frame {frame_index}  {t:.2f} s", (20, 40),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+    return view
+
+
+renderer.transform = render_debug_view
+
 print("Video file opened. Starting playback...")
 print("   - LEFT WINDOW: Undistorted (Should look like normal video)")
 print("   - RIGHT WINDOW: Warped (The Bird's Eye View)")
+print("   - Keys: 'd'/'a' = next/previous frame, 'w'/'s' = +/- 1 second,")
+print("           SPACE = play/pause, drag the slider to scrub,")
+print("           'p' = save a full-resolution still, 'q' = quit")
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("End of video or read error.")
-        break
+WINDOW = 'Debug: Left=Normal, Right=Warped'
+cv2.namedWindow(WINDOW)
+state = {"frame": 0}
 
-    # 1. Undistort
-    undistorted = cv2.undistort(frame, mtx, dist, None, mtx)
-    
-    # 2. Warp
-    # We use a large canvas to try and 'catch' the image if it's off-center
-    map_h, map_w = 2000, 1500 
-    warped = cv2.warpPerspective(undistorted, H, (map_w, map_h))
 
-    # 3. DEBUG: Draw an 'X' on the warped image center to prove the window is working
-    cv2.line(warped, (0,0), (map_w, map_h), (50, 50, 50), 2)
-    cv2.line(warped, (map_w, 0), (0, map_h), (50, 50, 50), 2)
+def on_slider(position):
+    state["frame"] = position
 
-    # 4. Display Side-by-Side (Resize for screen)
-    view_h = 600
-    aspect_ratio = undistorted.shape[1] / undistorted.shape[0]
-    view_w = int(view_h * aspect_ratio)
-    
-    show_raw = cv2.resize(undistorted, (view_w, view_h))
-    show_warp = cv2.resize(warped, (view_w, view_h))
 
-    cv2.imshow('Debug: Left=Normal, Right=Warped', np.hstack([show_raw, show_warp]))
+cv2.createTrackbar('Frame', WINDOW, 0, max(renderer.frame_count - 1, 1), on_slider)
 
-    if cv2.waitKey(0) & 0xFF == ord('q'): # <--- NOTE: waitKey(0) pauses on first frame!
+playing = False
+step_1s = max(int(round(renderer.fps)), 1)
+while True:
+    current = state["frame"]
+    view = renderer.get(current)
+    if view is None:
+        print(f"Error: could not decode frame {current}; the video may be truncated.")
         break
+    cv2.imshow(WINDOW, view)
+
+    # Paused: poll so slider moves are picked up (cached frames cost nothing)
+    key = cv2.waitKey(int(1000 / renderer.fps) if playing else 30) & 0xFF
+    if key == ord('q'):
+        break
+    elif key == ord(' '):
+        playing = not playing
+    elif key == ord('d'):
+        current += 1
+    elif key == ord('a'):
+        current -= 1
+    elif key == ord('w'):
+        current += step_1s
+    elif key == ord('s'):
+        current -= step_1s
+    elif key == ord('p'):
+        raw = renderer.frame(current)
+        if raw is None:
+            print(f"Error: could not decode frame {current}; no still saved.")
+        else:
+            still = geometry.render_still(data, raw, H, (MAP_W, MAP_H))
+            still_name = f"still_debug_{current:05d}.jpg"
+            cv2.imwrite(still_name, still)
+            print(f"Saved full-resolution still '{still_name}' ({MAP_W}x{MAP_H}).")
+    elif playing:
+        current += 1
+
+    if current >= renderer.frame_count:
+        print("End of video.")
+        current = renderer.frame_count - 1
+        playing = False
+    current = max(current, 0)
+    if current != state["frame"]:
+        state["frame"] = current
+        cv2.setTrackbarPos('Frame', WINDOW, current)
 
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+print(renderer.report())
+renderer.close()
+cv2.destroyAllWindows()
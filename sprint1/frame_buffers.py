@@ -0,0 +1,142 @@
+"""
+Preallocated frame buffers for the video loops.
+
+A BufferPool hands out named arrays that are allocated once, sized from the
+pipeline configuration, and reused on every frame. OpenCV calls write into
+them through dst= instead of returning new arrays.
+
+After mark_steady() the pool measures what each frame still allocates with
+tracemalloc: the peak of temporary NumPy/Python memory per frame (call
+end_frame() once per frame) and what is retained across frames. OpenCV's
+internal scratch and encoder buffers (cv2.imwrite, VideoWriter) are not
+visible to tracemalloc and are not included.
+"""
+
+import tracemalloc
+
+import numpy as np
+
+
+class BufferPool:
+    """Named, reusable numpy buffers with allocation counters."""
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.steady_reserves = 0
+        self.fallbacks = 0
+        self.writes = 0
+        self.steady_frames = 0
+        self.frame_peak_bytes = 0
+        self.frame_total_bytes = 0
+        self.retained_bytes = 0
+        self._steady = False
+        self._tracing = False
+        self._steady_base = 0
+        self._frame_base = 0
+
+    def reserve(self, name, shape, dtype=np.uint8):
+        """Allocate (or resize) a buffer up front; returns it."""
+        buf = self._buffers.get(name)
+        if buf is not None and buf.shape == tuple(shape) and buf.dtype == np.dtype(dtype):
+            return buf
+        buf = np.zeros(shape, dtype=dtype)
+        self._buffers[name] = buf
+        self.allocations += 1
+        self.allocated_bytes += buf.nbytes
+        if self._steady:
+            self.steady_reserves += 1
+        return buf
+
+    def get(self, name):
+        """Return a reserved buffer."""
+        return self._buffers[name]
+
+    def check(self, name, result):
+        """
+        Confirm an OpenCV call wrote into the pooled buffer.
+
+        OpenCV silently allocates a new array when dst has the wrong shape or
+        type; those cases are counted as fallbacks. Returns result unchanged.
+        """
+        if np.shares_memory(result, self._buffers[name]):
+            self.writes += 1
+        else:
+            self.fallbacks += 1
+        return result
+
+    def mark_steady(self):
+        """Call after the first frame; starts measuring per-frame allocations."""
+        self._steady = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        tracemalloc.reset_peak()
+        self._steady_base = self._frame_base = tracemalloc.get_traced_memory()[0]
+
+    def end_frame(self):
+        """Call at the end of every frame after mark_steady()."""
+        if not self._steady or not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self.steady_frames += 1
+        self.frame_peak_bytes = max(self.frame_peak_bytes, peak - self._frame_base)
+        self.frame_total_bytes += peak - self._frame_base
+        self.retained_bytes = current - self._steady_base
+        tracemalloc.reset_peak()
+        self._frame_base = current
+
+    def stop(self):
+        """Stop allocation tracing (if this pool started it)."""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def stats(self):
+        frames = max(self.steady_frames, 1)
+        return {
+            "buffers": len(self._buffers),
+            "allocations": self.allocations,
+            "allocated_mb": self.allocated_bytes / 1e6,
+            "steady_reserves": self.steady_reserves,
+            "fallbacks": self.fallbacks,
+            "writes": self.writes,
+            "steady_frames": self.steady_frames,
+            "frame_peak_mb": self.frame_peak_bytes / 1e6,
+            "frame_mean_mb": self.frame_total_bytes / frames / 1e6,
+            "retained_mb": self.retained_bytes / 1e6,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (f"Buffer pool: {s['buffers']} buffers, {s['allocations']} allocations "
+                f"({s['allocated_mb']:.1f} MB), {s['steady_reserves']} reserved after the first frame, "
+                f"{s['writes']} in-place writes, {s['fallbacks']} OpenCV fallbacks.\n"
+                f"   Steady state ({s['steady_frames']} frames, tracemalloc): temporary arrays up to "
+                f"{s['frame_peak_mb']:.2f} MB per frame (mean {s['frame_mean_mb']:.2f} MB), "
+                f"{s['retained_mb']:.2f} MB retained; OpenCV-internal scratch not included.")
+
+
+def pool_for_pipeline(frame_size, canvas_size, output_mode="bgr", grid_size=None):
+    """
+    Reserve the buffers the formation pipeline needs for one run.
+
+    canvas_size is the size rendered by the remap; in grid mode that is the
+    per-cell sample canvas, averaged down into the "grid" buffer.
+    """
+    frame_w, frame_h = frame_size
+    canvas_w, canvas_h = canvas_size
+    pool = BufferPool()
+    pool.reserve("frame", (frame_h, frame_w, 3))
+    if output_mode in ("gray", "grid"):
+        pool.reserve("gray", (frame_h, frame_w))
+    if output_mode == "grid":
+        grid_w, grid_h = grid_size
+        pool.reserve("warped", (canvas_h, canvas_w))
+        pool.reserve("grid", (grid_h, grid_w))
+    elif output_mode == "gray":
+        pool.reserve("warped", (canvas_h, canvas_w))
+    else:
+        pool.reserve("warped", (canvas_h, canvas_w, 3))
+    return pool
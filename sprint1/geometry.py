@@ -0,0 +1,200 @@
+"""
+Shared geometry helpers for the Sprint 1 scripts: loading the pipeline pickle
+and relating undistorted video pixels to metric positions on the ground plane.
+"""
+
+import pickle
+import cv2
+import numpy as np
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+PIPELINE_PATH = "geometry_pipeline_video.pkl"
+
+# Map scale used by calculate_homography.py (1 px on the map = 1 mm)
+PIXELS_PER_CM = 10
+
+# Fallback video resolution (must match VIDEO_W/VIDEO_H in fix_resolution.py)
+FRAME_W, FRAME_H = 1920, 1080
+
+# Canvas rows processed at a time when building remap validity masks
+MAP_STRIP_ROWS = 256
+
+
+def load_pipeline(path=PIPELINE_PATH):
+    """Load a geometry pipeline pickle (camera matrix, distortion, homography)."""
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def video_frame_size(video_path, default=(FRAME_W, FRAME_H)):
+    """Return (width, height) of a video, or the default if it cannot be read."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return default
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    if w <= 0 or h <= 0:
+        return default
+    return w, h
+
+
+def translation_matrix(shift_x, shift_y=0):
+    """3x3 translation applied on the map after the homography."""
+    return np.array([
+        [1, 0, shift_x],
+        [0, 1, shift_y],
+        [0, 0, 1],
+    ], dtype=np.float64)
+
+
+def scaled_homography(warp_matrix, scale_x, scale_y=None):
+    """
+    warp_matrix followed by a resize of its canvas by (scale_x, scale_y).
+
+    Rendering with the result gives the resized canvas directly, so previews
+    warp straight to the on-screen size. Pixel centres are mapped the way
+    cv2.resize maps them.
+    """
+    if scale_y is None:
+        scale_y = scale_x
+    resize = np.array([
+        [scale_x, 0, 0.5 * scale_x - 0.5],
+        [0, scale_y, 0.5 * scale_y - 0.5],
+        [0, 0, 1],
+    ], dtype=np.float64)
+    return resize @ warp_matrix
+
+
+def scaled_camera_matrix(camera_matrix, scale_x, scale_y=None):
+    """
+    Camera matrix for the same camera with its image resized by (scale_x, scale_y).
+
+    Focal lengths and principal point scale with the image, as in
+    fix_resolution.py.
+    """
+    if scale_y is None:
+        scale_y = scale_x
+    K = np.asarray(camera_matrix, dtype=np.float64).copy()
+    K[0, 0] *= scale_x
+    K[0, 2] *= scale_x
+    K[1, 1] *= scale_y
+    K[1, 2] *= scale_y
+    return K
+
+
+def render_still(data, frame, warp_matrix, canvas_size):
+    """Full-resolution bird's-eye view of one raw frame (undistort, then warp)."""
+    K = data["camera_matrix"]
+    undistorted = cv2.undistort(frame, K, data["dist_coeff"], None, K)
+    return cv2.warpPerspective(undistorted, warp_matrix, canvas_size)
+
+
+def ground_sign(homography_matrix, frame_size):
+    """
+    Sign of the homogeneous w coordinate for pixels that see the ground.
+
+    The bottom-centre pixel of a dashcam frame always looks at the road, so its
+    sign is the reference. Pixels with the opposite sign lie above the horizon.
+    """
+    w, h = frame_size
+    ref = homography_matrix @ np.array([w / 2.0, h - 1.0, 1.0])
+    return 1.0 if ref[2] >= 0 else -1.0
+
+
+def camera_ground_pose(camera_matrix, homography_matrix, frame_size,
+                       pixels_per_cm=PIXELS_PER_CM):
+    """
+    Recover where the camera sits relative to the ground plane.
+
+    Decomposes K^-1 * H^-1 * S (S scales cm to map pixels) into [r1 r2 t] and
+    returns the camera foot point on the ground (cm, map frame), its height
+    above the ground (cm) and the rotation from ground to camera.
+    """
+    S = np.diag([pixels_per_cm, pixels_per_cm, 1.0])
+    B = np.linalg.inv(camera_matrix) @ np.linalg.inv(homography_matrix) @ S
+    scale = (np.linalg.norm(B[:, 0]) + np.linalg.norm(B[:, 1])) / 2.0
+    # Depth of a ground pixel is 1 / (scale * w), so scale takes the sign of w
+    B = B / (scale * ground_sign(homography_matrix, frame_size))
+
+    r1, r2, t = B[:, 0], B[:, 1], B[:, 2]
+    R = np.column_stack([r1, r2, np.cross(r1, r2)])
+    U, _, Vt = np.linalg.svd(R)
+    R = U @ Vt
+
+    center = -R.T @ t
+    return {
+        "foot_cm": center[:2],
+        "height_cm": float(abs(center[2])),
+        "rotation": R,
+    }
+
+
+def pixels_to_ground(homography_matrix, points, pixels_per_cm=PIXELS_PER_CM):
+    """
+    Map undistorted pixel coordinates (N x 2) to ground coordinates in cm.
+
+    Returns (ground_cm, w) where w is the homogeneous coordinate; compare its
+    sign with ground_sign() to reject points above the horizon.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    homog = np.column_stack([pts, np.ones(len(pts))]) @ homography_matrix.T
+    w = homog[:, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ground = homog[:, :2] / w[:, None] / pixels_per_cm
+    return ground, w
+
+
+def build_birdseye_maps(data, warp_matrix, canvas_size, frame_size, strip_rows=MAP_STRIP_ROWS):
+    """
+    Remap tables that undistort and warp a raw frame in a single cv2.remap.
+
+    warp_matrix maps undistorted pixels to canvas pixels (e.g. translation @ H).
+    Returns (map1, map2, valid): fixed-point maps for cv2.remap and a uint8
+    mask of canvas pixels that receive image content.
+
+    cv2.initUndistortRectifyMap does the projection row by row straight into
+    the fixed-point maps (its "rectification" R is the inverse warp folded
+    into K); the validity mask is then computed in strips of strip_rows rows,
+    so memory scales with the maps rather than with the canvas as float64.
+    """
+    canvas_w, canvas_h = canvas_size
+    frame_w, frame_h = frame_size
+    K = data["camera_matrix"]
+    D = data["dist_coeff"]
+
+    # Canvas pixel -> normalized camera coordinates (homogeneous)
+    canvas_to_norm = np.linalg.inv(K) @ np.linalg.inv(warp_matrix)
+    map1, map2 = cv2.initUndistortRectifyMap(
+        K, D, np.linalg.inv(canvas_to_norm), np.eye(3), (canvas_w, canvas_h), cv2.CV_16SC2
+    )
+
+    # Canvas points are ground points; keep those in front of the camera and
+    # within the field of view of the raw frame, so strong distortion terms
+    # cannot fold far points back into it
+    sign = ground_sign(warp_matrix, frame_size)
+    border = np.array([[0, 0], [frame_w / 2, 0], [frame_w, 0], [frame_w, frame_h / 2],
+                       [frame_w, frame_h], [frame_w / 2, frame_h], [0, frame_h],
+                       [0, frame_h / 2]], dtype=np.float64).reshape(-1, 1, 2)
+    border_norm = cv2.undistortPoints(border, K, D).reshape(-1, 2)
+    max_radius_sq = np.float32((border_norm ** 2).sum(axis=1).max())
+
+    N = canvas_to_norm.astype(np.float32)
+    us = np.arange(canvas_w, dtype=np.float32)
+    valid = np.empty((canvas_h, canvas_w), np.uint8)
+    for y0 in range(0, canvas_h, strip_rows):
+        y1 = min(y0 + strip_rows, canvas_h)
+        vs = np.arange(y0, y1, dtype=np.float32)[:, None]
+        x = N[0, 0] * us + (N[0, 1] * vs + N[0, 2])
+        y = N[1, 0] * us + (N[1, 1] * vs + N[1, 2])
+        w = N[2, 0] * us + (N[2, 1] * vs + N[2, 2])
+        ok = (w * sign > 0) & (x * x + y * y <= max_radius_sq * (w * w))
+        strip = map1[y0:y1]
+        ok &= ((strip[..., 0] >= 0) & (strip[..., 0] < frame_w - 1)
+               & (strip[..., 1] >= 0) & (strip[..., 1] < frame_h - 1))
+        strip[~ok] = -1
+        map2[y0:y1][~ok] = 0
+        valid[y0:y1] = ok
+    return map1, map2, valid
@@ -0,0 +1,330 @@
+"""
+Visual odometry from the ground plane.
+
+The ground canvas is metric, so the motion of the road texture between
+consecutive frames is the vehicle's own motion. Each frame is remapped straight
+onto a small decimated ground canvas (ODOMETRY_CM_PER_PX per pixel) and
+compared with the previous one:
+
+  1. a first yaw from the shift along the angle axis of the polar-resampled
+     Fourier magnitudes (independent of translation),
+  2. translation from phase correlation after undoing that rotation,
+  3. refinement: the motion found so far is undone and the rotation and shift
+     left over are measured, first from the shifts of the four halves of the
+     canvas, then by least squares on the image gradient.
+
+The canvas is weighted by a soft mask of the area that sees the road and a
+Hanning window, so the fixed border of the view does not pull the estimate
+towards zero. Motion is reported at the camera foot point: sideways and
+forward displacement, yaw, speed, and the integrated heading and path.
+
+Run directly to write ODOMETRY_CSV for the whole video; the formation
+pipeline writes the same file alongside its exported frames.
+"""
+
+import csv
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+import canvas_layout
+import geometry
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+VIDEO_PATH = "road_test.mp4"
+ODOMETRY_CSV = os.path.join("sprint1_frames", "odometry.csv")
+
+# Ground resolution of the odometry canvas (the exported canvas is 0.1 cm/px)
+ODOMETRY_CM_PER_PX = 2.0
+
+# Ground area used: up to this far from the camera and this far to each side
+ODOMETRY_RANGE_CM = 600
+ODOMETRY_HALF_WIDTH_CM = 200
+
+# Pixels trimmed off the edge of the road mask, and the width of its soft edge
+MASK_ERODE_PX = 3
+MASK_FEATHER_PX = 6
+
+# Angle bins of the polar spectrum (first yaw estimate, refined below)
+ANGLE_BINS = 720
+
+# The spectrum and the first shift are pulled towards zero by the fixed
+# window, so the motion found is undone and what is left is measured:
+# HALF_REFINE_STEPS passes from how the four halves of the window move against
+# each other (phase correlation, for larger residuals), then REFINE_STEPS
+# least-squares passes on the image gradient (sub-pixel residuals)
+HALF_REFINE_STEPS = 2
+REFINE_STEPS = 3
+
+# Smoothing (px) before the gradient passes
+REFINE_BLUR_PX = 1.0
+
+# A spectrum estimate above this (deg per frame) is taken as a false peak and
+# the yaw refinement starts from zero instead
+MAX_YAW_DEG = 10.0
+
+# Frames whose translation peak response is below this are treated as
+# unreliable (no texture, motion blur) and reported as zero motion
+MIN_RESPONSE = 0.05
+
+CSV_FIELDS = [
+    "frame", "time_s", "side_cm", "forward_cm", "yaw_deg",
+    "speed_kmh", "heading_deg", "x_cm", "y_cm", "response",
+]
+
+
+class GroundOdometry:
+    """Frame-to-frame ground motion of one camera; call update() once per frame."""
+
+    def __init__(self, data, frame_size, fps, cm_per_px=ODOMETRY_CM_PER_PX,
+                 max_range_cm=ODOMETRY_RANGE_CM, max_half_width_cm=ODOMETRY_HALF_WIDTH_CM):
+        self.fps = fps
+        self.cm_per_px = cm_per_px
+
+        layout = canvas_layout.compute_canvas_layout(
+            data, frame_size, max_range_cm, max_pixels=None,
+            max_half_width_cm=max_half_width_cm,
+        )
+        scale = 1.0 / (cm_per_px * geometry.PIXELS_PER_CM)
+        self.canvas_size = (max(int(layout["width"] * scale), 16), max(int(layout["height"] * scale), 16))
+        warp = geometry.scaled_homography(canvas_layout.layout_homography(data, layout), scale)
+        self.map1, self.map2, valid = geometry.build_birdseye_maps(data, warp, self.canvas_size, frame_size)
+
+        # Soft road mask times a Hanning window
+        kernel = np.ones((2 * MASK_ERODE_PX + 1, 2 * MASK_ERODE_PX + 1), np.uint8)
+        mask = cv2.erode(valid, kernel).astype(np.float32)
+        mask = cv2.GaussianBlur(mask, (0, 0), MASK_FEATHER_PX / 2.0) * mask
+        self.window = mask * cv2.createHanningWindow(self.canvas_size, cv2.CV_32F)
+        self.window_sum = float(self.window.sum())
+        self.center = ((self.canvas_size[0] - 1) / 2.0, (self.canvas_size[1] - 1) / 2.0)
+
+        # A small rotation by angle (rad) about the centre moves the pixel at
+        # lever (lx, ly) from the centre by angle * (ly, -lx)
+        ys, xs = np.mgrid[0:self.canvas_size[1], 0:self.canvas_size[0]].astype(np.float32)
+        self._lever_x = xs - self.center[0]
+        self._lever_y = ys - self.center[1]
+
+        # Near, far, left and right halves of the window, split at its
+        # centroid; _half_solve recovers (dx, dy, angle) from their four shifts
+        cx = float((self.window * xs).sum()) / max(self.window_sum, 1e-6)
+        cy = float((self.window * ys).sum()) / max(self.window_sum, 1e-6)
+        self._half_windows = []
+        rows = []
+        for half in (ys < cy, ys >= cy, xs < cx, xs >= cx):
+            w = self.window * half
+            total = max(float(w.sum()), 1e-6)
+            lx = float((w * xs).sum()) / total - self.center[0]
+            ly = float((w * ys).sum()) / total - self.center[1]
+            self._half_windows.append(w)
+            rows += [[1.0, 0.0, ly], [0.0, 1.0, -lx]]
+        self._half_solve = np.linalg.pinv(np.array(rows))
+
+        # Camera foot point on the odometry canvas: the point the motion refers to
+        pose = geometry.camera_ground_pose(data["camera_matrix"], data["homography_matrix"], frame_size)
+        foot_px = geometry.translation_matrix(layout["shift_x"], layout["shift_y"]) @ np.array(
+            [pose["foot_cm"][0] * geometry.PIXELS_PER_CM, pose["foot_cm"][1] * geometry.PIXELS_PER_CM, 1.0])
+        self.foot = (foot_px[:2] + 0.5) * scale - 0.5
+
+        # Vehicle axes on the canvas: the camera's viewing direction and its
+        # image x axis laid on the ground (the board, and so the map, need not
+        # be square to the vehicle, and the map may be mirrored)
+        R = pose["rotation"]
+        self.forward_dir = R[2, :2] / np.linalg.norm(R[2, :2])
+        right = R[0, :2] - (R[0, :2] @ self.forward_dir) * self.forward_dir
+        self.right_dir = right / np.linalg.norm(right)
+        # +1 when right is clockwise of forward as drawn on the canvas (not mirrored)
+        self.handedness = 1.0 if self.right_dir @ (-self.forward_dir[1], self.forward_dir[0]) > 0 else -1.0
+
+        self._small = np.zeros((self.canvas_size[1], self.canvas_size[0], 3), np.uint8)
+        self._gray = np.zeros((self.canvas_size[1], self.canvas_size[0]), np.uint8)
+        self._prev = None          # previous centred image, unweighted
+        self._prev_polar = None
+        self.frames = 0
+        self.heading_deg = 0.0
+        self.position_cm = np.zeros(2)
+
+    def _prepare(self, frame):
+        """
+        Remap a raw frame to the odometry canvas.
+
+        Returns (image, weighted image, polar spectrum); image has the mean
+        inside the mask removed so the mask edge is not a feature.
+        """
+        cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=self._small)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        centered = self._gray.astype(np.float32)
+        centered -= float((centered * self.window).sum()) / max(self.window_sum, 1e-6)
+        img = centered * self.window
+
+        # Translation-invariant magnitude spectrum, high-passed, in polar form
+        mag = np.fft.fftshift(np.abs(np.fft.fft2(img))).astype(np.float32)
+        mag = np.log1p(mag)
+        mag -= cv2.GaussianBlur(mag, (0, 0), 3)
+        w, h = self.canvas_size
+        polar = cv2.warpPolar(mag, (min(w, h) // 2, ANGLE_BINS), (w / 2.0, h / 2.0), min(w, h) / 2.0,
+                              cv2.INTER_LINEAR + cv2.WARP_POLAR_LINEAR)
+        return centered, img, polar
+
+    def _moved(self, centered, M):
+        """Unweighted image moved by M, then weighted; the window stays where it is."""
+        return cv2.warpAffine(centered, M, self.canvas_size, flags=cv2.INTER_LINEAR) * self.window
+
+    def _undo(self, rotation, dx, dy):
+        """Affine matrix that takes (dx, dy) off and then undoes rotation (about the centre)."""
+        M = cv2.getRotationMatrix2D(self.center, -rotation, 1.0)
+        M[:, 2] -= M[:, :2] @ (dx, dy)
+        return M
+
+    def _half_residual(self, prev, moved):
+        """Motion (dx px, dy px, rotation deg) of moved against prev, from the window halves."""
+        shifts = [cv2.phaseCorrelate(prev * w, moved * w)[0] for w in self._half_windows]
+        dx, dy, angle = self._half_solve @ np.ravel(shifts)
+        return dx, dy, np.degrees(angle)
+
+    def _gradient_residual(self, prev, moved):
+        """Motion (dx px, dy px, rotation deg) of moved against prev, by weighted least squares."""
+        prev = cv2.GaussianBlur(prev, (0, 0), REFINE_BLUR_PX)
+        moved = cv2.GaussianBlur(moved, (0, 0), REFINE_BLUR_PX)
+        gx = cv2.Sobel(prev, cv2.CV_32F, 1, 0, ksize=3, scale=1 / 8.0)
+        gy = cv2.Sobel(prev, cv2.CV_32F, 0, 1, ksize=3, scale=1 / 8.0)
+        # moved - prev ~ -(gradient . motion of each pixel)
+        J = np.stack([gx, gy, gx * self._lever_y - gy * self._lever_x], axis=-1).reshape(-1, 3)
+        weighted = J * self.window.reshape(-1, 1)
+        dx, dy, angle = np.linalg.lstsq(weighted.T @ J, weighted.T @ (prev - moved).reshape(-1),
+                                        rcond=None)[0]
+        return dx, dy, np.degrees(angle)
+
+    def _motion(self, prev, cur, cur_polar):
+        """
+        Rigid canvas motion prev -> cur as (rotation deg, dx px, dy px, response).
+
+        prev and cur are the unweighted centred images. The texture turns by
+        rotation about the canvas centre and then moves by (dx, dy).
+        """
+        (_, angle_shift), _ = cv2.phaseCorrelate(self._prev_polar, cur_polar)
+        # Polar angles run clockwise on the canvas; rotations here are counter-clockwise
+        rotation = -angle_shift * 360.0 / ANGLE_BINS
+        # The magnitude spectrum repeats every 180 degrees
+        rotation = (rotation + 90.0) % 180.0 - 90.0
+        if abs(rotation) > MAX_YAW_DEG:
+            rotation = 0.0
+
+        # Undo the rotation about the canvas centre, then find the shift
+        weighted_prev = prev * self.window
+        (dx, dy), _ = cv2.phaseCorrelate(weighted_prev, self._moved(cur, self._undo(rotation, 0, 0)))
+
+        # Undo the motion found so far and measure the rotation and shift left
+        steps = [self._half_residual] * HALF_REFINE_STEPS + [self._gradient_residual] * REFINE_STEPS
+        for residual in steps:
+            moved = cv2.warpAffine(cur, self._undo(rotation, dx, dy), self.canvas_size, flags=cv2.INTER_LINEAR)
+            rx, ry, rr = residual(prev, moved)
+            rotation, dx, dy = rotation + rr, dx + rx, dy + ry
+
+        _, response = cv2.phaseCorrelate(weighted_prev, self._moved(cur, self._undo(rotation, dx, dy)))
+        return rotation, dx, dy, response
+
+    def update(self, frame, frame_id):
+        """Process the next frame; returns a CSV row (dict)."""
+        centered, img, polar = self._prepare(frame)
+        side = forward = yaw = 0.0
+        response = 1.0
+        if self._prev is not None:
+            rotation, dx, dy, response = self._motion(self._prev, centered, polar)
+            if response >= MIN_RESPONSE:
+                side, forward, yaw = self._vehicle_motion(rotation, dx, dy)
+            else:
+                side = forward = yaw = 0.0
+        self._prev, self._prev_polar = centered, polar
+        return self._row(frame_id, side, forward, yaw, response)
+
+    def _vehicle_motion(self, rotation, dx, dy):
+        """
+        Convert the ground texture's motion on the canvas into the vehicle's.
+
+        The texture moves by rotation about the canvas centre and then (dx, dy);
+        the vehicle moves by the inverse. Returns (side cm, forward cm, yaw deg)
+        at the camera foot point along the camera's ground axes, yaw positive
+        to the left.
+        """
+        # Where the texture motion takes the foot point
+        R = cv2.getRotationMatrix2D(self.center, rotation, 1.0)
+        moved = R[:, :2] @ self.foot + R[:, 2] + (dx, dy)
+        # The vehicle moves the opposite way
+        delta = (self.foot - moved) * self.cm_per_px
+        # Counter-clockwise texture rotation on an unmirrored canvas = right turn
+        yaw = -rotation * self.handedness
+        return float(delta @ self.right_dir), float(delta @ self.forward_dir), float(yaw)
+
+    def _row(self, frame_id, side, forward, yaw, response):
+        # Integrate in the frame of the first image (x right, y forward)
+        heading = np.radians(self.heading_deg)
+        c, s = np.cos(heading), np.sin(heading)
+        self.position_cm += (c * side - s * forward, s * side + c * forward)
+        self.heading_deg += yaw
+        speed_kmh = float(np.hypot(side, forward)) * self.fps * 3600 / 100000.0
+        time_s = self.frames / self.fps
+        self.frames += 1
+        return {
+            "frame": frame_id,
+            "time_s": round(time_s, 4),
+            "side_cm": round(side, 2),
+            "forward_cm": round(forward, 2),
+            "yaw_deg": round(yaw, 3),
+            "speed_kmh": round(speed_kmh, 2),
+            "heading_deg": round(self.heading_deg, 3),
+            "x_cm": round(float(self.position_cm[0]), 1),
+            "y_cm": round(float(self.position_cm[1]), 1),
+            "response": round(float(response), 3),
+        }
+
+
+def main():
+    try:
+        data = geometry.load_pipeline()
+    except FileNotFoundError:
+        print(f"Error: '{geometry.PIPELINE_PATH}' not found. Run Step 3 first.")
+        sys.exit()
+
+    cap = cv2.VideoCapture(VIDEO_PATH)
+    if not cap.isOpened():
+        print(f"Error: Could not open video '{VIDEO_PATH}'.")
+        sys.exit()
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    odometry = GroundOdometry(data, frame_size, fps)
+    w, h = odometry.canvas_size
+    print(f"Odometry canvas: {w}x{h} px at {ODOMETRY_CM_PER_PX} cm/px.")
+
+    os.makedirs(os.path.dirname(ODOMETRY_CSV) or ".", exist_ok=True)
+    frame = np.zeros((frame_size[1], frame_size[0], 3), np.uint8)
+    frame_id = 0
+    busy = 0.0
+    with open(ODOMETRY_CSV, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        while True:
+            ret, frame = cap.read(frame)
+            if not ret:
+                break
+            # Frame numbers start at 1, as in the formation pipeline's CSV files
+            frame_id += 1
+            t0 = time.time()
+            row = odometry.update(frame, frame_id)
+            busy += time.time() - t0
+            writer.writerow(row)
+    cap.release()
+
+    if frame_id:
+        print(f"Odometry for {frame_id} frames written to '{ODOMETRY_CSV}' "
+              f"({busy / frame_id * 1000:.1f} ms per frame, excluding decode).")
+        print(f"   Distance {np.hypot(*odometry.position_cm) / 100:.2f} m, "
+              f"heading change {odometry.heading_deg:.1f} deg.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Compute the video pipeline's homography straight from a calibration clip.
+
+Instead of a separate still photo (homography_setup.jpg) that then has to be
+rescaled by fix_resolution.py, this scans a short clip of the checkerboard
+lying on the ground, filmed by the mounted camera at its video resolution:
+
+  1. The clip is split into one chunk per worker process; each seeks to its
+     chunk and examines every SAMPLE_EVERY-th frame.
+  2. Sampled frames are undistorted the way the video scripts do it and run
+     through the detection cascade of calculate_homography.py.
+  3. Candidates are scored by sharpness (variance of the Laplacian over the
+     board) times coverage (board area relative to the search region).
+  4. H is computed from the best frame, averaging the corners of the other
+     top frames that saw the board in the same place.
+
+The camera matrix is scaled from the calibration photo size stored in
+camera_calibration.pkl, and the result is written as
+geometry_pipeline_video.pkl, ready for the video scripts.
+"""
+
+import os
+import pickle
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+import calculate_homography
+import geometry
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+CALIBRATION_VIDEO = "homography_setup.mp4"
+CALIBRATION_PATH = "camera_calibration.pkl"
+OUTPUT_PATH = "geometry_pipeline_video.pkl"
+
+# Only used when camera_calibration.pkl does not record its image size
+# (calibrated before calibrate_camera.py stored it)
+CALIBRATION_IMAGE_SIZE = (3358, 1884)
+
+# Examine every Nth frame of the clip
+SAMPLE_EVERY = 5
+
+WORKERS = os.cpu_count() or 1
+
+# Frames kept for the final estimate
+TOP_FRAMES = 5
+
+# Top frames whose corners lie within this distance (px, mean) of the best
+# frame's are averaged with it; the board and camera did not move between them
+STATIC_TOLERANCE_PX = 1.5
+
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+
+def video_camera_matrix(calibration, frame_size):
+    """Camera matrix of the calibration scaled to the video resolution."""
+    photo_w, photo_h = calibration.get("image_size", CALIBRATION_IMAGE_SIZE)
+    frame_w, frame_h = frame_size
+    return geometry.scaled_camera_matrix(calibration["camera_matrix"], frame_w / photo_w, frame_h / photo_h)
+
+
+def score_board(gray, corners, crop_area):
+    """(sharpness, coverage) of a detected board."""
+    hull = cv2.convexHull(corners.reshape(-1, 2).astype(np.float32))
+    x, y, w, h = cv2.boundingRect(hull)
+    patch = gray[y:y + h, x:x + w]
+    sharpness = float(cv2.Laplacian(patch, cv2.CV_64F).var()) if patch.size else 0.0
+    coverage = float(cv2.contourArea(hull)) / crop_area
+    return sharpness, coverage
+
+
+def scan_chunk(args):
+    """
+    Examine every SAMPLE_EVERY-th frame in [start, end) of the clip.
+
+    Runs in a worker process. Returns a list of candidate dicts with the
+    frame index, full-frame corners, sharpness and coverage.
+    """
+    video_path, start, end, K, D, sample_every = args
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    frame_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    # Same undistortion as the video scripts (new camera matrix = K)
+    map1, map2 = cv2.initUndistortRectifyMap(K, D, None, K, (frame_w, frame_h), cv2.CV_16SC2)
+    x_start, x_end, y_start, y_end = calculate_homography.crop_bounds(frame_w, frame_h)
+    crop_area = float((x_end - x_start) * (y_end - y_start))
+
+    candidates = []
+    frame = np.zeros((frame_h, frame_w, 3), np.uint8)
+    for index in range(start, end):
+        if (index - start) % sample_every:
+            if not cap.grab():
+                break
+            continue
+        if not cap.read(frame)[0]:
+            break
+        undistorted = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+        gray = cv2.cvtColor(undistorted, cv2.COLOR_BGR2GRAY)
+        corners = calculate_homography.detect_board(gray[y_start:y_end, x_start:x_end], verbose=False)
+        if corners is None:
+            continue
+        corners = corners.astype(np.float32)
+        corners[:, :, 0] += x_start
+        corners[:, :, 1] += y_start
+        corners = cv2.cornerSubPix(gray, corners, (5, 5), (-1, -1), SUBPIX_CRITERIA)
+        sharpness, coverage = score_board(gray, corners, crop_area)
+        candidates.append({"frame": index, "corners": corners,
+                           "sharpness": sharpness, "coverage": coverage})
+    cap.release()
+    return candidates
+
+
+def scan_video(video_path, K, D, workers=WORKERS, sample_every=SAMPLE_EVERY):
+    """Scan the clip in parallel chunks; returns all candidates, best first."""
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    # Chunk starts fall on sampled frames so the chunks tile the same subset
+    per_chunk = -(-max(total, 1) // max(workers, 1))
+    per_chunk = -(-per_chunk // sample_every) * sample_every
+    chunks = [(video_path, s, min(s + per_chunk, total), K, D, sample_every)
+              for s in range(0, total, per_chunk)]
+
+    if len(chunks) > 1:
+        with Pool(min(workers, len(chunks))) as pool:
+            results = pool.map(scan_chunk, chunks)
+    else:
+        results = [scan_chunk(c) for c in chunks]
+    candidates = [c for chunk in results for c in chunk]
+
+    if candidates:
+        top_sharpness = max(c["sharpness"] for c in candidates) or 1.0
+        for c in candidates:
+            c["score"] = c["sharpness"] / top_sharpness * c["coverage"]
+        candidates.sort(key=lambda c: c["score"], reverse=True)
+    return candidates, total
+
+
+def combine_corners(candidates, top=TOP_FRAMES, tolerance=STATIC_TOLERANCE_PX):
+    """
+    Corners of the best frame averaged with the top frames that agree with it.
+
+    The detector may list the corners from either end of the board, so each
+    frame is compared in both orders. Returns (corners, frames used).
+    """
+    best = candidates[0]["corners"].reshape(-1, 2)
+    agreeing = [best]
+    used = [candidates[0]["frame"]]
+    for c in candidates[1:top]:
+        pts = c["corners"].reshape(-1, 2)
+        for candidate_pts in (pts, pts[::-1]):
+            if np.linalg.norm(candidate_pts - best, axis=1).mean() <= tolerance:
+                agreeing.append(candidate_pts)
+                used.append(c["frame"])
+                break
+    return np.mean(agreeing, axis=0).reshape(-1, 1, 2).astype(np.float32), used
+
+
+def main():
+    try:
+        with open(CALIBRATION_PATH, "rb") as f:
+            calibration = pickle.load(f)
+    except FileNotFoundError:
+        print(f"Error: '{CALIBRATION_PATH}' not found. Run Step 1 first.")
+        sys.exit()
+
+    cap = cv2.VideoCapture(CALIBRATION_VIDEO)
+    if not cap.isOpened():
+        print(f"Error: Could not open calibration clip '{CALIBRATION_VIDEO}'.")
+        sys.exit()
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    if "image_size" not in calibration:
+        print(f"   Calibration image size not recorded; assuming {CALIBRATION_IMAGE_SIZE}.")
+    K = video_camera_matrix(calibration, frame_size)
+    D = calibration["dist_coeff"]
+
+    print(f"Scanning '{CALIBRATION_VIDEO}' ({frame_size[0]}x{frame_size[1]}) for the board: "
+          f"every {SAMPLE_EVERY}th frame, {WORKERS} worker(s)...")
+    t0 = time.time()
+    candidates, total = scan_video(CALIBRATION_VIDEO, K, D)
+    print(f"   Board found in {len(candidates)} of {-(-total // SAMPLE_EVERY)} sampled frames "
+          f"({time.time() - t0:.1f} s).")
+    if not candidates:
+        print("Error: Checkerboard not found in the clip.")
+        print(f"   1. Is the board actually {calculate_homography.CHECKERBOARD_DIMS}? Count the INNER CORNERS again.")
+        print("   2. Keep the whole board inside the lower middle of the view (see the crop settings).")
+        sys.exit()
+
+    for c in candidates[:TOP_FRAMES]:
+        print(f"   Frame {c['frame']:5d}: score {c['score']:.4f} "
+              f"(sharpness {c['sharpness']:.0f}, coverage {c['coverage'] * 100:.1f}%)")
+
+    corners, used = combine_corners(candidates)
+    print(f"   Using frame {used[0]}" + (f", averaged with frames {used[1:]}" if len(used) > 1 else "") + ".")
+
+    H = calculate_homography.compute_homography(corners)
+    mapped = cv2.perspectiveTransform(corners, H).reshape(-1, 2)
+    residual = np.linalg.norm(mapped - calculate_homography.board_map_points(), axis=1)
+    print(f"   Board fit: mean {residual.mean():.2f} px, max {residual.max():.2f} px on the map "
+          f"({1 / calculate_homography.PIXELS_PER_CM:.1f} cm per px).")
+
+    # Visual checks on the best frame
+    cap = cv2.VideoCapture(CALIBRATION_VIDEO)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, used[0])
+    ret, frame = cap.read()
+    cap.release()
+    if ret:
+        undistorted = cv2.undistort(frame, K, D, None, K)
+        debug = undistorted.copy()
+        cv2.drawChessboardCorners(debug, calculate_homography.CHECKERBOARD_DIMS, corners, True)
+        cv2.imwrite("debug_corners_video_frame.jpg", debug)
+        warped = cv2.warpPerspective(undistorted, H, (1200, 2000))
+        cv2.line(warped, (100, 100), (200, 100), (0, 0, 255), 5)
+        cv2.putText(warped, "10 cm", (100, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        cv2.imwrite("verification_3_birdseye_video.jpg", warped)
+
+    data = {
+        "camera_matrix": K,
+        "dist_coeff": D,
+        "homography_matrix": H,
+    }
+    with open(OUTPUT_PATH, "wb") as f:
+        pickle.dump(data, f)
+    print(f"\nSuccess! Created '{OUTPUT_PATH}' at {frame_size[0]}x{frame_size[1]} "
+          f"(no fix_resolution.py step needed). Check 'verification_3_birdseye_video.jpg'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Metric lookup tables: precompute, for every undistorted video pixel (or a
+subsampled grid), the ground-plane position and range from the camera so that
+distance queries become plain array lookups.
+
+Tables are cached per resolution in METRIC_LUT_DIR as quantized int16 .npy
+files and opened memory-mapped, so loading them costs almost nothing.
+"""
+
+import hashlib
+import os
+import pickle
+import cv2
+import numpy as np
+
+import geometry
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+VIDEO_PATH = "road_test.mp4"
+PIPELINE_PATH = geometry.PIPELINE_PATH
+METRIC_LUT_DIR = "metric_lut"
+
+# Sample every Nth undistorted pixel (1 = every pixel)
+GRID_STEP = 1
+
+# Anything further than this from the camera foot point is masked out
+MAX_RANGE_CM = 10000
+
+# Quantization of stored cm values (int16 * 0.5 cm covers +/- 163 m)
+QUANT_CM = 0.5
+
+# Mask codes stored alongside the table
+MASK_HORIZON = 0        # ray never reaches the ground (sky, horizon)
+MASK_VALID = 1
+MASK_OUT_OF_RANGE = 2   # on the ground but beyond MAX_RANGE_CM
+
+
+def pipeline_fingerprint(data, frame_size, step, max_range_cm, quant_cm):
+    """Hash of everything the table depends on; used to invalidate the cache."""
+    h = hashlib.sha1()
+    for key in ("camera_matrix", "dist_coeff", "homography_matrix"):
+        h.update(np.ascontiguousarray(data[key], dtype=np.float64).tobytes())
+    h.update(repr((tuple(frame_size), step, max_range_cm, quant_cm)).encode())
+    return h.hexdigest()
+
+
+def build_metric_lut(data, frame_size, step=GRID_STEP,
+                     max_range_cm=MAX_RANGE_CM, quant_cm=QUANT_CM):
+    """
+    Compute the lookup table for one resolution.
+
+    Returns (xyr, mask, meta): xyr is (rows, cols, 3) int16 holding ground X, Y
+    and range in units of quant_cm; mask is (rows, cols) uint8 with MASK_* codes.
+    """
+    w, h = frame_size
+    H = data["homography_matrix"]
+    pose = geometry.camera_ground_pose(data["camera_matrix"], H, frame_size)
+
+    xs = np.arange(0, w, step, dtype=np.float64)
+    ys = np.arange(0, h, step, dtype=np.float64)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    pts = np.column_stack([grid_x.ravel(), grid_y.ravel()])
+
+    ground, hw = geometry.pixels_to_ground(H, pts)
+    on_ground = np.sign(hw) == geometry.ground_sign(H, frame_size)
+    rng = np.hypot(ground[:, 0] - pose["foot_cm"][0],
+                   ground[:, 1] - pose["foot_cm"][1])
+    in_range = on_ground & (rng <= max_range_cm)
+
+    limit = np.iinfo(np.int16).max * quant_cm
+    in_range &= (np.abs(ground) <= limit).all(axis=1)
+
+    mask = np.full(len(pts), MASK_HORIZON, dtype=np.uint8)
+    mask[on_ground] = MASK_OUT_OF_RANGE
+    mask[in_range] = MASK_VALID
+
+    xyr = np.zeros((len(pts), 3), dtype=np.int16)
+    values = np.column_stack([ground[in_range], rng[in_range]])
+    xyr[in_range] = np.round(values / quant_cm).astype(np.int16)
+
+    meta = {
+        "frame_size": (w, h),
+        "step": step,
+        "max_range_cm": max_range_cm,
+        "quant_cm": quant_cm,
+        "foot_cm": pose["foot_cm"],
+        "height_cm": pose["height_cm"],
+    }
+    return xyr.reshape(len(ys), len(xs), 3), mask.reshape(len(ys), len(xs)), meta
+
+
+class MetricLookup:
+    """Memory-mapped metric table with O(1) per-pixel queries."""
+
+    def __init__(self, xyr, mask, meta, data):
+        self.xyr = xyr
+        self.mask = mask
+        self.meta = meta
+        self.step = meta["step"]
+        self.quant_cm = meta["quant_cm"]
+        self.camera_matrix = data["camera_matrix"]
+        self.dist_coeff = data["dist_coeff"]
+
+    def _cells(self, points):
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        rows, cols = self.mask.shape
+        c = np.clip(np.rint(pts[:, 0] / self.step).astype(np.intp), 0, cols - 1)
+        r = np.clip(np.rint(pts[:, 1] / self.step).astype(np.intp), 0, rows - 1)
+        w, h = self.meta["frame_size"]
+        inside = (pts[:, 0] >= 0) & (pts[:, 0] < w) & (pts[:, 1] >= 0) & (pts[:, 1] < h)
+        return r, c, inside
+
+    def lookup_many(self, points):
+        """
+        Look up undistorted pixels (N x 2).
+
+        Returns (xyr_cm, valid): xyr_cm is N x 3 float32 (X cm, Y cm, range cm),
+        NaN where the pixel is above the horizon, out of range or off-frame.
+        """
+        r, c, inside = self._cells(points)
+        valid = inside & (self.mask[r, c] == MASK_VALID)
+        out = self.xyr[r, c].astype(np.float32) * self.quant_cm
+        out[~valid] = np.nan
+        return out, valid
+
+    def lookup(self, x, y):
+        """Ground (X cm, Y cm, range cm) for one undistorted pixel, or None."""
+        out, valid = self.lookup_many([(x, y)])
+        return tuple(out[0]) if valid[0] else None
+
+    def lookup_raw(self, points):
+        """Same as lookup_many() but for pixels in the raw (distorted) frame."""
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        undist = cv2.undistortPoints(pts, self.camera_matrix, self.dist_coeff,
+                                     P=self.camera_matrix)
+        return self.lookup_many(undist.reshape(-1, 2))
+
+
+def load_metric_lookup(data, frame_size, step=GRID_STEP,
+                       max_range_cm=MAX_RANGE_CM, quant_cm=QUANT_CM,
+                       cache_dir=METRIC_LUT_DIR):
+    """Open the cached table for this resolution, building it if stale or missing."""
+    w, h = frame_size
+    folder = os.path.join(cache_dir, f"{w}x{h}_step{step}")
+    xyr_path = os.path.join(folder, "xyr.npy")
+    mask_path = os.path.join(folder, "mask.npy")
+    meta_path = os.path.join(folder, "meta.pkl")
+    fingerprint = pipeline_fingerprint(data, frame_size, step, max_range_cm, quant_cm)
+
+    meta = None
+    if os.path.isfile(meta_path):
+        with open(meta_path, "rb") as f:
+            meta = pickle.load(f)
+
+    if (meta is None or meta.get("fingerprint") != fingerprint
+            or not os.path.isfile(xyr_path) or not os.path.isfile(mask_path)):
+        print(f"Building metric lookup table for {w}x{h} (step {step})...")
+        xyr, mask, meta = build_metric_lut(data, frame_size, step, max_range_cm, quant_cm)
+        meta["fingerprint"] = fingerprint
+        os.makedirs(folder, exist_ok=True)
+        np.save(xyr_path, xyr)
+        np.save(mask_path, mask)
+        with open(meta_path, "wb") as f:
+            pickle.dump(meta, f)
+
+    xyr = np.load(xyr_path, mmap_mode="r")
+    mask = np.load(mask_path, mmap_mode="r")
+    return MetricLookup(xyr, mask, meta, data)
+
+
+def main():
+    if not os.path.isfile(PIPELINE_PATH):
+        print(f"Error: '{PIPELINE_PATH}' not found.")
+        return
+
+    data = geometry.load_pipeline(PIPELINE_PATH)
+    frame_size = geometry.video_frame_size(VIDEO_PATH)
+    lut = load_metric_lookup(data, frame_size)
+
+    w, h = frame_size
+    valid_share = float(np.mean(lut.mask == MASK_VALID)) * 100
+    print(f"Metric lookup ready: {lut.mask.shape[1]}x{lut.mask.shape[0]} cells, "
+          f"{valid_share:.1f}% valid.")
+    print(f"   Camera height above ground: {lut.meta['height_cm']:.1f} cm")
+
+    # Sample queries down the centre line of the frame
+    for fy in (1.0, 0.9, 0.8, 0.7, 0.6):
+        px, py = w / 2, h * fy - 1
+        hit = lut.lookup(px, py)
+        if hit is None:
+            print(f"   Pixel ({px:.0f}, {py:.0f}): no ground (horizon or out of range)")
+        else:
+            print(f"   Pixel ({px:.0f}, {py:.0f}): X={hit[0]:.1f} cm, "
+                  f"Y={hit[1]:.1f} cm, range={hit[2]:.1f} cm")
+
+
+if __name__ == "__main__":
+    main()
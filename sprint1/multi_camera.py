@@ -0,0 +1,192 @@
+"""
+Multi-camera fusion: render N calibrated cameras into one shared metric
+bird's-eye canvas.
+
+Each camera has its own geometry pipeline pickle and a pose describing where
+its map frame sits in the shared vehicle frame. Remap tables (undistort + warp
+in one step) and feathered blend weights are built once at start-up; fusing a
+frame set is then one cv2.remap per camera (run in parallel) and a weighted sum.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+import canvas_layout
+import geometry
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+# One entry per camera. "pose" places the camera's map frame (from its own
+# homography) in the shared vehicle frame: (x_cm, y_cm, yaw_deg).
+CAMERAS = [
+    {
+        "name": "front",
+        "pipeline": "geometry_pipeline_video.pkl",
+        "video": "road_test.mp4",
+        "pose": (0.0, 0.0, 0.0),
+    },
+]
+
+OUTPUT_FILENAME = "fused_birdseye.mp4"
+
+# Shared canvas: union of every camera's footprint, limited as in canvas_layout.py
+MAX_RANGE_CM = canvas_layout.MAX_RANGE_CM
+MAX_CANVAS_PIXELS = canvas_layout.MAX_CANVAS_PIXELS
+MARGIN_PX = canvas_layout.MARGIN_PX
+
+# Width (px) of the cross-fade where two cameras overlap
+FEATHER_PX = 200
+
+
+def pose_matrix(pose, pixels_per_cm=geometry.PIXELS_PER_CM):
+    """3x3 map-pixel transform for a (x_cm, y_cm, yaw_deg) camera pose."""
+    x_cm, y_cm, yaw_deg = pose
+    c, s = np.cos(np.radians(yaw_deg)), np.sin(np.radians(yaw_deg))
+    return np.array([
+        [c, -s, x_cm * pixels_per_cm],
+        [s, c, y_cm * pixels_per_cm],
+        [0, 0, 1],
+    ], dtype=np.float64)
+
+
+def shared_canvas_layout(cameras, max_range_cm=MAX_RANGE_CM,
+                         max_pixels=MAX_CANVAS_PIXELS, margin_px=MARGIN_PX):
+    """
+    Canvas size, shift and scale that hold the footprints of all cameras.
+
+    Like canvas_layout.compute_canvas_layout, an oversized canvas keeps the
+    full range at a lower resolution.
+    """
+    points = []
+    for cam in cameras:
+        footprint = canvas_layout.ground_footprint(cam["data"], cam["frame_size"], max_range_cm)
+        homog = np.column_stack([footprint, np.ones(len(footprint))])
+        points.append((homog @ pose_matrix(cam["pose"]).T)[:, :2])
+    points = np.vstack(points)
+    if len(points) == 0:
+        raise ValueError(f"No ground visible within {max_range_cm:.0f} cm of any camera.")
+
+    x_min, y_min = np.floor(points.min(axis=0))
+    x_max, y_max = np.ceil(points.max(axis=0))
+    layout = canvas_layout.fit_to_budget(x_min, y_min, x_max, y_max, max_pixels, margin_px)
+    layout["max_range_cm"] = float(max_range_cm)
+    return layout
+
+
+def blend_weights(valid_masks, feather_px=FEATHER_PX):
+    """
+    Per-camera single-channel float32 weights that sum to 1 wherever any
+    camera sees the ground.
+
+    Weights ramp up with distance from the edge of each camera's footprint, so
+    overlaps cross-fade instead of showing a seam.
+    """
+    ramps = []
+    for valid in valid_masks:
+        dist = cv2.distanceTransform(valid, cv2.DIST_L2, 5)
+        ramps.append(np.minimum(dist, feather_px).astype(np.float32))
+    total = np.sum(ramps, axis=0)
+    total[total == 0] = 1.0
+    return [r / total for r in ramps]
+
+
+class FusedBirdseye:
+    """Precomputed remap tables and blend weights for a camera rig."""
+
+    def __init__(self, cameras):
+        self.cameras = cameras
+        self.layout = shared_canvas_layout(cameras)
+        self.canvas_size = (self.layout["width"], self.layout["height"])
+        shift = geometry.translation_matrix(self.layout["shift_x"], self.layout["shift_y"])
+
+        self.maps = []
+        valid_masks = []
+        for cam in cameras:
+            warp = geometry.scaled_homography(
+                shift @ pose_matrix(cam["pose"]) @ cam["data"]["homography_matrix"], self.layout["scale"]
+            )
+            map1, map2, valid = geometry.build_birdseye_maps(
+                cam["data"], warp, self.canvas_size, cam["frame_size"]
+            )
+            self.maps.append((map1, map2))
+            valid_masks.append(valid)
+        # (h, w, 1) views broadcast over the colour channels
+        self.weights = [weight[..., None] for weight in blend_weights(valid_masks)]
+
+        w, h = self.canvas_size
+        self._warped = [np.zeros((h, w, 3), np.uint8) for _ in cameras]
+        self._weighted = [np.zeros((h, w, 3), np.float32) for _ in cameras]
+        self._total = np.zeros((h, w, 3), np.float32)
+        self._fused = np.zeros((h, w, 3), np.uint8)
+        self._pool = ThreadPoolExecutor(max_workers=len(cameras))
+
+    def _render_camera(self, i, frame):
+        map1, map2 = self.maps[i]
+        cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, dst=self._warped[i])
+        np.multiply(self._warped[i], self.weights[i], out=self._weighted[i])
+
+    def fuse(self, frames):
+        """Fuse one raw frame per camera (same order as cameras) into the canvas."""
+        list(self._pool.map(self._render_camera, range(len(frames)), frames))
+        np.copyto(self._total, self._weighted[0])
+        for weighted in self._weighted[1:]:
+            cv2.add(self._total, weighted, dst=self._total)
+        np.copyto(self._fused, self._total, casting="unsafe")
+        return self._fused
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def main():
+    cameras = []
+    caps = []
+    for cam in CAMERAS:
+        if not os.path.isfile(cam["pipeline"]):
+            print(f"Error: '{cam['pipeline']}' not found for camera '{cam['name']}'.")
+            return
+        cap = cv2.VideoCapture(cam["video"])
+        if not cap.isOpened():
+            print(f"Error: Could not open video '{cam['video']}' for camera '{cam['name']}'.")
+            return
+        frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                      int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        cameras.append(dict(cam, data=geometry.load_pipeline(cam["pipeline"]),
+                            frame_size=frame_size))
+        caps.append(cap)
+
+    print(f"Building remap tables and blend weights for {len(cameras)} camera(s)...")
+    fused = FusedBirdseye(cameras)
+    canvas_w, canvas_h = fused.canvas_size
+    print(f"Shared canvas: {canvas_w}x{canvas_h} (range {fused.layout['max_range_cm']:.0f} cm, "
+          f"{fused.layout['pixels_per_cm']:.2f} px/cm)")
+
+    fps = int(caps[0].get(cv2.CAP_PROP_FPS))
+    if fps <= 0:
+        fps = 30
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(OUTPUT_FILENAME, fourcc, fps, (canvas_w, canvas_h))
+
+    frame_id = 0
+    with ThreadPoolExecutor(max_workers=len(caps)) as readers:
+        while True:
+            results = list(readers.map(lambda c: c.read(), caps))
+            if not all(ret for ret, _ in results):
+                break
+            frame_id += 1
+            out.write(fused.fuse([frame for _, frame in results]))
+            if frame_id % 50 == 0:
+                print(f"   Fused {frame_id} frame sets...")
+
+    for cap in caps:
+        cap.release()
+    out.release()
+    fused.close()
+    print(f"Done. Saved {frame_id} fused frames to '{OUTPUT_FILENAME}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Make-style runner for the Sprint 1 steps.
+
+Every step declares the files it reads and writes. Steps run in this process
+(one cv2 import for the whole chain) via runpy, and a step is skipped when its
+outputs are still the ones it last wrote and none of its inputs has changed
+since. Changes are detected from file size and modification time, like make;
+an output rewritten by another step (e.g. geometry_pipeline_video.pkl from
+--from-video) makes the step run again.
+Steps without outputs (interactive previews) always run unless excluded.
+The scripts call sys.exit() with no code on errors, so a step that exits that
+way only counts as a success if it wrote all of its declared outputs.
+
+Usage:
+    python3 pipeline_runner.py            # run what is out of date
+    python3 pipeline_runner.py --force    # rerun everything
+    python3 pipeline_runner.py --no-preview
+    python3 pipeline_runner.py --from-video  # homography from homography_setup.mp4
+"""
+
+import glob
+import os
+import pickle
+import runpy
+import sys
+import time
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+STATE_PATH = ".pipeline_state.pkl"
+
+# Modules shared by the video scripts; editing them invalidates those steps
+VIDEO_MODULES = ["geometry.py", "canvas_layout.py", "frame_buffers.py", "ground_odometry.py"]
+
+# (script, inputs, outputs). Inputs may be glob patterns; an output ending in
+# "/" is a folder that must exist and be non-empty.
+STEPS = [
+    (
+        "calibrate_camera.py",
+        ["calibration_images/*.jpg"],
+        ["camera_calibration.pkl", "verification_1_corners_found.jpg", "verification_2_undistorted.jpg"],
+    ),
+    (
+        "calculate_homography.py",
+        ["camera_calibration.pkl", "homography_setup.jpg"],
+        ["geometry_pipeline.pkl", "verification_3_birdseye.jpg"],
+    ),
+    (
+        "fix_resolution.py",
+        ["geometry_pipeline.pkl"],
+        ["geometry_pipeline_video.pkl"],
+    ),
+    (
+        "test_on_video.py",
+        ["geometry_pipeline_video.pkl", "road_test.mp4"] + VIDEO_MODULES,
+        ["sprint1_result.mp4"],
+    ),
+    (
+        "test_on_video_wide.py",
+        ["geometry_pipeline_video.pkl", "road_test.mp4"] + VIDEO_MODULES,
+        [],
+    ),
+    (
+        "create_side_by_side.py",
+        ["geometry_pipeline_video.pkl", "road_test.mp4"] + VIDEO_MODULES,
+        ["sprint1_demo_reel.mp4"],
+    ),
+    (
+        "pipeline_sprint1_formation.py",
+        ["geometry_pipeline_video.pkl", "road_test.mp4"] + VIDEO_MODULES,
+        ["sprint1_frames/"],
+    ),
+]
+
+# With --from-video this step replaces the photo-based Steps 2-3. It writes
+# the same pickle as fix_resolution.py; whichever ran last owns it, and the
+# other reruns when its recorded output no longer matches
+VIDEO_HOMOGRAPHY_STEP = (
+    "homography_from_video.py",
+    ["camera_calibration.pkl", "homography_setup.mp4", "calculate_homography.py", "geometry.py"],
+    ["geometry_pipeline_video.pkl", "verification_3_birdseye_video.jpg"],
+)
+PHOTO_HOMOGRAPHY_SCRIPTS = ("calculate_homography.py", "fix_resolution.py")
+
+
+def steps_from_video(steps=STEPS):
+    """The steps with the homography computed from the calibration clip."""
+    result = []
+    for step in steps:
+        if step[0] in PHOTO_HOMOGRAPHY_SCRIPTS:
+            if VIDEO_HOMOGRAPHY_STEP not in result:
+                result.append(VIDEO_HOMOGRAPHY_STEP)
+            continue
+        result.append(step)
+    return result
+
+
+def input_signature(script, inputs):
+    """(path, size, mtime) for the script and every file matching its inputs."""
+    files = [script]
+    for pattern in inputs:
+        matches = sorted(glob.glob(pattern))
+        files.extend(matches if matches else [pattern])
+    signature = []
+    for path in files:
+        if os.path.isfile(path):
+            st = os.stat(path)
+            signature.append((path, st.st_size, st.st_mtime_ns))
+        else:
+            signature.append((path, None, None))
+    return signature
+
+
+def output_signature(outputs):
+    """(path, size, mtime) per output; a folder counts its entries and newest mtime."""
+    signature = []
+    for path in outputs:
+        if path.endswith("/"):
+            if not os.path.isdir(path):
+                signature.append((path, None, None))
+                continue
+            entries = [os.path.join(path, name) for name in os.listdir(path)]
+            newest = max((os.stat(p).st_mtime_ns for p in entries), default=None)
+            signature.append((path, len(entries), newest))
+        elif os.path.isfile(path):
+            st = os.stat(path)
+            signature.append((path, st.st_size, st.st_mtime_ns))
+        else:
+            signature.append((path, None, None))
+    return signature
+
+
+def outputs_present(outputs):
+    for path in outputs:
+        if path.endswith("/"):
+            if not os.path.isdir(path) or not os.listdir(path):
+                return False
+        elif not os.path.isfile(path):
+            return False
+    return True
+
+
+def outputs_written_since(outputs, since):
+    """True if the step has outputs and every one was (re)written after since."""
+    if not outputs:
+        return False
+    for path in outputs:
+        if path.endswith("/"):
+            entries = [os.path.join(path, name) for name in os.listdir(path)]
+            mtime = max(os.path.getmtime(p) for p in entries) if entries else 0
+        else:
+            mtime = os.path.getmtime(path)
+        if mtime < since:
+            return False
+    return True
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    with open(path, "wb") as f:
+        pickle.dump(state, f)
+
+
+def run_step(script):
+    """
+    Execute a script in this process as if it were __main__.
+
+    Returns "ok" when the script ran to the end, "exited" when it called
+    sys.exit() with no code (or 0), and "failed" otherwise.
+    """
+    saved_argv = sys.argv
+    sys.argv = [script]
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        # The scripts call sys.exit() with no code on errors, so a clean exit
+        # is judged by the outputs afterwards, not by the code alone
+        return "exited" if e.code in (None, 0) else "failed"
+    except KeyboardInterrupt:
+        print("\n[WARNING] Step interrupted by user.")
+        return "failed"
+    except Exception as e:
+        print(f"\n[ERROR] {script}: {e}")
+        return "failed"
+    finally:
+        sys.argv = saved_argv
+    return "ok"
+
+
+def run_pipeline(steps=STEPS, force=False, include_previews=True, verify_texts=None):
+    """
+    Run the steps in order, skipping the up-to-date ones.
+
+    Stops at the first failing step. Returns a list of
+    (script, status, seconds) with status "ran", "skipped", "failed" or
+    "excluded".
+    """
+    state = load_state()
+    report = []
+    for script, inputs, outputs in steps:
+        if not outputs and not include_previews:
+            report.append((script, "excluded", 0.0))
+            continue
+
+        if not os.path.exists(script):
+            print(f"\n[ERROR] File '{script}' not found.")
+            report.append((script, "failed", 0.0))
+            break
+
+        last = state.get(script)
+        if not isinstance(last, dict):
+            last = {}   # not run yet, or recorded by an older runner
+        if (not force and outputs and outputs_present(outputs)
+                and last.get("inputs") == input_signature(script, inputs)
+                and last.get("outputs") == output_signature(outputs)):
+            print(f"[SKIP] {script} is up to date.")
+            report.append((script, "skipped", 0.0))
+            continue
+
+        print(f"\n[LAUNCH] Starting: {script}")
+        if verify_texts and script in verify_texts:
+            print("=" * 75)
+            print(f"[VERIFY] WHAT TO EXPECT / CHECK:")
+            print(f"   {verify_texts[script]}")
+            print("=" * 75)
+
+        start_time = time.time()
+        result = run_step(script)
+        ok = result != "failed" and outputs_present(outputs)
+        if result == "exited":
+            # Stale outputs from an earlier run do not count
+            ok = ok and outputs_written_since(outputs, start_time - 1)
+        elapsed = time.time() - start_time
+
+        if not ok:
+            print(f"[FAILED] {script} after {elapsed:.2f} seconds; stopping.")
+            state.pop(script, None)
+            save_state(state)
+            report.append((script, "failed", elapsed))
+            break
+
+        # Record what the step was built from and what it wrote, re-read after it ran
+        state[script] = {"inputs": input_signature(script, inputs),
+                         "outputs": output_signature(outputs)}
+        save_state(state)
+        print(f"[STATUS] {script} finished in {elapsed:.2f} seconds.")
+        report.append((script, "ran", elapsed))
+    return report
+
+
+def print_report(report):
+    print("-" * 75)
+    print("STEP TIMING")
+    print("-" * 75)
+    total = 0.0
+    for script, status, seconds in report:
+        total += seconds
+        print(f"   {script:<34} {status:<9} {seconds:8.2f} s")
+    print(f"   {'TOTAL':<34} {'':<9} {total:8.2f} s")
+
+
+def main():
+    force = "--force" in sys.argv
+    include_previews = "--no-preview" not in sys.argv
+    steps = steps_from_video() if "--from-video" in sys.argv else STEPS
+    print_report(run_pipeline(steps, force=force, include_previews=include_previews))
+
+
+if __name__ == "__main__":
+    main()
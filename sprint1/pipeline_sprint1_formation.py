@@ -1,13 +1,46 @@
 """
 Sprint 1 Formation Pipeline: Process dashboard video through the geometry pipeline
 and output a metric top-down video plus per-frame images for analysis.
+
+OUTPUT_MODE selects what is exported per frame:
+  "bgr"  - full colour bird's-eye JPEG with overlays (original output)
+  "gray" - single-channel luminance JPEG; the frame is converted before the
+           undistort/warp so only one channel is ever resampled
+  "grid" - coarse metric luminance grid (GRID_CELL_CM per cell) saved as a
+           uint8 .npy, plus one validity mask for the whole run. Each cell is
+           the mean grey level of the ground it covers; it is not an
+           occupancy estimate
+
+The automatic canvas keeps the whole road footprint, so a footprint larger
+than AUTO_MAX_PIXELS is rendered below 10 px/cm. Every row of index.csv
+records pixels_per_cm and the canvas shift (map px) used for the frames.
+
+With ODOMETRY on, the vehicle's motion is estimated from the road texture of
+consecutive frames (see ground_odometry.py) and written to odometry.csv
+next to the frames. The odometry does not use the buffer pool, so the frame
+loop is then not allocation-free (the steady-state report includes it).
+
+With MOTION_GATING on (off by default), a small grey thumbnail of each decoded
+frame is compared with the one of the last rendered frame, over the part of
+the frame that lands on the canvas (the ground; sky and bonnet are ignored).
+Frames that barely differ (vehicle stopped) reuse the previous bird's-eye
+output; if they fall on an export slot, index.csv points at the already
+written file instead of encoding a new one. The folder then holds fewer
+files than export slots, so consumers must read index.csv rather than list
+the frame files.
 """
 
+import csv
 import os
 import pickle
 import cv2
 import numpy as np
 
+import canvas_layout
+import frame_buffers
+import geometry
+import ground_odometry
+
 # -----------------------------------------------------------------------------
 # Configuration
 # -----------------------------------------------------------------------------
@@ -15,6 +48,12 @@ VIDEO_PATH = "road_test.mp4"
 PIPELINE_PATH = "geometry_pipeline_video.pkl"
 OUTPUT_FRAMES_DIR = "sprint1_frames"
 
+# Size the canvas from the projected road footprint (see canvas_layout.py).
+# When False, the hand-tuned square canvas and shift below are used instead.
+AUTO_CANVAS = True
+AUTO_MAX_RANGE_CM = canvas_layout.MAX_RANGE_CM
+AUTO_MAX_PIXELS = canvas_layout.MAX_CANVAS_PIXELS
+
 # Square canvas so exported frames show the full bird's-eye view (not cropped)
 CANVAS_SIZE = 2000
 CANVAS_WIDTH = CANVAS_SIZE
@@ -23,14 +62,80 @@ CANVAS_HEIGHT = CANVAS_SIZE
 SHIFT_X = 750
 SHIFT_Y = 0
 
+# What to export per frame: "bgr", "gray" or "grid" (see module docstring)
+OUTPUT_MODE = "bgr"
+
+# Cell size of the "grid" output (5 cm = 50 canvas px at 10 px/cm)
+GRID_CELL_CM = 5
+
 # Export a frame image only every Nth video frame (1 = every frame, 2 = every 2nd, etc.)
 FRAME_EXPORT_EVERY = 2
 
+# Reuse the previous output when the frame has not changed (vehicle stopped).
+# The change measure is the mean absolute grey-level difference between
+# MOTION_THUMB_SIZE thumbnails of this frame and the last rendered frame,
+# taken over the ground region only. At 160x90, ground moving 1.5 cm per
+# frame measures about 4, a stationary camera with sensor noise below 0.5.
+MOTION_GATING = False
+MOTION_THUMB_SIZE = (160, 90)
+MOTION_THRESHOLD = 1.0
+# Force a fresh render after this many gated frames in a row
+MOTION_MAX_REUSE = 300
+
+# Estimate speed and heading from the ground texture (odometry.csv)
+ODOMETRY = True
+
 # Scale overlay: 100 px line represents 10 cm
 SCALE_LINE_LENGTH_PX = 100
 SCALE_LABEL = "10 cm (Scale)"
 
 
+def draw_overlays(warped, frame_id, canvas_height, pixels_per_cm=geometry.PIXELS_PER_CM):
+    """Scale reference and frame label; colours collapse to grey levels on 1-channel frames."""
+    # Draw scale reference: red line = 10 cm (100 px at full resolution)
+    scale_x1, scale_y = 100, 100
+    scale_x2 = scale_x1 + int(round(SCALE_LINE_LENGTH_PX * pixels_per_cm / geometry.PIXELS_PER_CM))
+    cv2.line(
+        warped,
+        (scale_x1, scale_y),
+        (scale_x2, scale_y),
+        (0, 0, 255),
+        10,
+    )
+    cv2.putText(
+        warped,
+        SCALE_LABEL,
+        (scale_x1, scale_y - 20),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        2.0,
+        (0, 0, 255),
+        5,
+    )
+
+    # Draw frame ID on bottom left
+    frame_text = f"Frame {frame_id}"
+    cv2.putText(
+        warped,
+        frame_text,
+        (50, canvas_height - 80),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        2.0,
+        (255, 255, 255),
+        5,
+    )
+
+
+def ground_thumb_mask(map1, valid, frame_size, thumb_size, step=4):
+    """uint8 mask of the thumbnail cells whose raw pixels land on the canvas."""
+    frame_w, frame_h = frame_size
+    thumb_w, thumb_h = thumb_size
+    raw = map1[::step, ::step][valid[::step, ::step] > 0].astype(np.int64)
+    mask = np.zeros((thumb_h, thumb_w), np.uint8)
+    mask[np.clip(raw[:, 1] * thumb_h // frame_h, 0, thumb_h - 1),
+         np.clip(raw[:, 0] * thumb_w // frame_w, 0, thumb_w - 1)] = 255
+    return mask
+
+
 def main():
     # -------------------------------------------------------------------------
     # Load geometry pipeline
@@ -42,21 +147,9 @@ def main():
     with open(PIPELINE_PATH, "rb") as f:
         data = pickle.load(f)
 
-    camera_matrix = data["camera_matrix"]
-    dist_coeff = data["dist_coeff"]
     homography_matrix = data["homography_matrix"]
     print(f"Loaded geometry pipeline from '{PIPELINE_PATH}'.")
 
-    # -------------------------------------------------------------------------
-    # Build final warp matrix: translation then homography
-    # -------------------------------------------------------------------------
-    translation = np.array([
-        [1, 0, SHIFT_X],
-        [0, 1, SHIFT_Y],
-        [0, 0, 1],
-    ], dtype=np.float64)
-    H_final = translation @ homography_matrix
-
     # -------------------------------------------------------------------------
     # Open video and prepare output
     # -------------------------------------------------------------------------
@@ -65,6 +158,36 @@ def main():
         print(f"Error: Could not open video '{VIDEO_PATH}'.")
         return
 
+    frame_size = (
+        int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    )
+
+    # -------------------------------------------------------------------------
+    # Build final warp matrix: translation then homography
+    # -------------------------------------------------------------------------
+    if AUTO_CANVAS:
+        layout = canvas_layout.compute_canvas_layout(
+            data, frame_size, AUTO_MAX_RANGE_CM, AUTO_MAX_PIXELS
+        )
+        canvas_width, canvas_height = layout["width"], layout["height"]
+        pixels_per_cm = layout["pixels_per_cm"]
+        shift_x, shift_y = layout["shift_x"], layout["shift_y"]
+        H_final = canvas_layout.layout_homography(data, layout)
+        print(f"Auto canvas: {canvas_width}x{canvas_height} "
+              f"(range {layout['max_range_cm']:.0f} cm, {pixels_per_cm:.2f} px/cm, "
+              f"shift {layout['shift_x']}, {layout['shift_y']}).")
+    else:
+        canvas_width, canvas_height = CANVAS_WIDTH, CANVAS_HEIGHT
+        pixels_per_cm = geometry.PIXELS_PER_CM
+        shift_x, shift_y = SHIFT_X, SHIFT_Y
+        translation = np.array([
+            [1, 0, SHIFT_X],
+            [0, 1, SHIFT_Y],
+            [0, 0, 1],
+        ], dtype=np.float64)
+        H_final = translation @ homography_matrix
+
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     if fps <= 0:
         fps = 30
@@ -74,7 +197,78 @@ def main():
 
     # Create output folder for frames if it does not exist
     os.makedirs(OUTPUT_FRAMES_DIR, exist_ok=True)
-    print(f"Output frames will be saved to '{OUTPUT_FRAMES_DIR}/' (no video export).")
+    print(f"Output frames will be saved to '{OUTPUT_FRAMES_DIR}/' (no video export, mode '{OUTPUT_MODE}').")
+
+    # -------------------------------------------------------------------------
+    # Remap tables: undistort and warp in one cv2.remap straight from the raw
+    # frame (cv2.undistort would rebuild its maps on every call). Grid mode
+    # remaps at a whole number of samples per cell (no coarser than the
+    # canvas) and averages each cell with an INTER_AREA resize, so near-field
+    # cells are not single point samples.
+    # -------------------------------------------------------------------------
+    grid_size = None
+    render_size = (canvas_width, canvas_height)
+    if OUTPUT_MODE == "grid":
+        cell_px = GRID_CELL_CM * pixels_per_cm
+        grid_width = int(np.ceil(canvas_width / cell_px))
+        grid_height = int(np.ceil(canvas_height / cell_px))
+        grid_size = (grid_width, grid_height)
+        samples = max(int(np.ceil(cell_px)), 1)
+        render_size = (grid_width * samples, grid_height * samples)
+        map1, map2, render_valid = geometry.build_birdseye_maps(
+            data, geometry.scaled_homography(H_final, samples / cell_px), render_size, frame_size
+        )
+        # A cell is valid when all of its samples see the ground
+        grid_valid = (cv2.resize(render_valid * 255, grid_size, interpolation=cv2.INTER_AREA) == 255)
+        grid_valid = grid_valid.astype(np.uint8)
+        np.save(os.path.join(OUTPUT_FRAMES_DIR, "grid_valid_mask.npy"), grid_valid)
+        with open(os.path.join(OUTPUT_FRAMES_DIR, "grid_meta.pkl"), "wb") as f:
+            pickle.dump({
+                "cell_cm": GRID_CELL_CM,
+                "grid_size": grid_size,
+                "canvas_homography": H_final,
+                "pixels_per_cm": pixels_per_cm,
+            }, f)
+        print(f"Grid output: {grid_width}x{grid_height} cells of {GRID_CELL_CM} cm "
+              f"({samples}x{samples} samples averaged per cell).")
+    else:
+        map1, map2, render_valid = geometry.build_birdseye_maps(
+            data, H_final, (canvas_width, canvas_height), frame_size
+        )
+
+    # Preallocated buffers: every OpenCV call below writes through dst=
+    pool = frame_buffers.pool_for_pipeline(
+        frame_size, render_size, OUTPUT_MODE, grid_size
+    )
+    frame_buf = pool.get("frame")
+    warped = pool.get("warped")
+    grid = pool.get("grid") if OUTPUT_MODE == "grid" else None
+    gray = pool.get("gray") if OUTPUT_MODE in ("gray", "grid") else None
+    thumb_w, thumb_h = MOTION_THUMB_SIZE
+    thumb_bgr = pool.reserve("thumb_bgr", (thumb_h, thumb_w, 3))
+    thumb = pool.reserve("thumb", (thumb_h, thumb_w))
+    thumb_ref = pool.reserve("thumb_ref", (thumb_h, thumb_w))
+    thumb_diff = pool.reserve("thumb_diff", (thumb_h, thumb_w))
+    thumb_mask = pool.reserve("thumb_mask", (thumb_h, thumb_w))
+    if MOTION_GATING:
+        thumb_mask[:] = ground_thumb_mask(map1, render_valid, frame_size, MOTION_THUMB_SIZE)
+
+    # index.csv maps every export slot to the file holding its output, with
+    # the canvas scale and shift (map px) so the frames can be measured
+    index_file = open(os.path.join(OUTPUT_FRAMES_DIR, "index.csv"), "w", newline="")
+    index = csv.writer(index_file)
+    index.writerow(["export", "frame", "file", "gated", "rendered_frame",
+                    "pixels_per_cm", "shift_x", "shift_y"])
+
+    # odometry.csv: per-frame speed and heading from the ground texture
+    odometry = None
+    if ODOMETRY:
+        odometry = ground_odometry.GroundOdometry(data, frame_size, fps)
+        odometry_file = open(os.path.join(OUTPUT_FRAMES_DIR, "odometry.csv"), "w", newline="")
+        odometry_csv = csv.DictWriter(odometry_file, fieldnames=ground_odometry.CSV_FIELDS)
+        odometry_csv.writeheader()
+        odo_w, odo_h = odometry.canvas_size
+        print(f"Odometry on a {odo_w}x{odo_h} canvas ({ground_odometry.ODOMETRY_CM_PER_PX} cm/px).")
 
     # No video export: frames only
     out = None
@@ -83,56 +277,51 @@ def main():
     # Process each frame
     # -------------------------------------------------------------------------
     frame_id = 0
+    rendered_frame_id = None  # frame currently held in the warped buffer
+    rendered_file = None      # file that already holds that render, if any
+    gated_count = 0
+    gated_run = 0
     while True:
-        ret, frame = cap.read()
+        ret, frame = cap.read(frame_buf)
         if not ret:
             break
+        pool.check("frame", frame)
 
         frame_id += 1
 
-        # Undistort using camera matrix and distortion coefficients
-        undistorted = cv2.undistort(
-            frame, camera_matrix, dist_coeff, None, camera_matrix
-        )
+        # Cheap change detector on a small thumbnail of the ground
+        gated = False
+        if MOTION_GATING:
+            pool.check("thumb_bgr", cv2.resize(frame, MOTION_THUMB_SIZE, dst=thumb_bgr, interpolation=cv2.INTER_AREA))
+            pool.check("thumb", cv2.cvtColor(thumb_bgr, cv2.COLOR_BGR2GRAY, dst=thumb))
+            if rendered_frame_id is not None and gated_run < MOTION_MAX_REUSE:
+                pool.check("thumb_diff", cv2.absdiff(thumb, thumb_ref, dst=thumb_diff))
+                gated = cv2.mean(thumb_diff, mask=thumb_mask)[0] < MOTION_THRESHOLD
 
-        # Warp to top-down view on the large canvas
-        warped = cv2.warpPerspective(
-            undistorted,
-            H_final,
-            (CANVAS_WIDTH, CANVAS_HEIGHT),
-        )
+        if gated:
+            gated_count += 1
+            gated_run += 1
+        else:
+            gated_run = 0
+            source = frame
+            if gray is not None:
+                source = pool.check("gray", cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray))
 
-        # Draw scale reference: 100 px red line = 10 cm
-        scale_x1, scale_y = 100, 100
-        scale_x2 = scale_x1 + SCALE_LINE_LENGTH_PX
-        cv2.line(
-            warped,
-            (scale_x1, scale_y),
-            (scale_x2, scale_y),
-            (0, 0, 255),
-            10,
-        )
-        cv2.putText(
-            warped,
-            SCALE_LABEL,
-            (scale_x1, scale_y - 20),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            2.0,
-            (0, 0, 255),
-            5,
-        )
+            # Undistort + warp to the top-down canvas in one pass
+            pool.check("warped", cv2.remap(source, map1, map2, cv2.INTER_LINEAR, dst=warped))
+            if OUTPUT_MODE == "grid":
+                pool.check("grid", cv2.resize(warped, grid_size, dst=grid, interpolation=cv2.INTER_AREA))
+            else:
+                draw_overlays(warped, frame_id, canvas_height, pixels_per_cm)
+            rendered_frame_id = frame_id
+            rendered_file = None
+            if MOTION_GATING:
+                thumb_ref[:] = thumb
 
-        # Draw frame ID on bottom left
-        frame_text = f"Frame {frame_id}"
-        cv2.putText(
-            warped,
-            frame_text,
-            (50, CANVAS_HEIGHT - 80),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            2.0,
-            (255, 255, 255),
-            5,
-        )
+        # Every decoded frame is measured; a gated frame can still have moved
+        # a little, and skipping it would drop that motion from the path
+        if odometry is not None:
+            odometry_csv.writerow(odometry.update(frame, frame_id))
 
         # Video export disabled
         if out is not None:
@@ -141,11 +330,26 @@ def main():
         # Save frame as JPEG only every Nth frame to reduce disk usage
         if frame_id % FRAME_EXPORT_EVERY == 1:
             export_count = (frame_id - 1) // FRAME_EXPORT_EVERY + 1
-            frame_filename = os.path.join(
-                OUTPUT_FRAMES_DIR,
-                f"frame_{export_count:03d}.jpg",
-            )
-            cv2.imwrite(frame_filename, warped)
+            if rendered_file is None:
+                if OUTPUT_MODE == "grid":
+                    rendered_file = f"grid_{export_count:03d}.npy"
+                    np.save(os.path.join(OUTPUT_FRAMES_DIR, rendered_file), grid)
+                else:
+                    rendered_file = f"frame_{export_count:03d}.jpg"
+                    frame_filename = os.path.join(
+                        OUTPUT_FRAMES_DIR,
+                        rendered_file,
+                    )
+                    cv2.imwrite(frame_filename, warped)
+            # Gated slots reference the file written for the reused render
+            index.writerow([export_count, frame_id, rendered_file, int(gated), rendered_frame_id,
+                            round(pixels_per_cm, 6), shift_x, shift_y])
+
+        # Measure what each frame after the first still allocates
+        if frame_id == 1:
+            pool.mark_steady()
+        else:
+            pool.end_frame()
 
         # Progress message
         if total_frames is not None:
@@ -154,10 +358,27 @@ def main():
             print(f"Processing frame {frame_id}...")
 
     cap.release()
+    index_file.close()
+    if odometry is not None:
+        odometry_file.close()
     if out is not None:
         out.release()
     exported_count = (frame_id + FRAME_EXPORT_EVERY - 1) // FRAME_EXPORT_EVERY
-    print(f"Done. Frames saved to '{OUTPUT_FRAMES_DIR}/' ({exported_count} images, {CANVAS_SIZE}x{CANVAS_SIZE}, every {FRAME_EXPORT_EVERY}th frame).")
+    pool.stop()
+    print(pool.report())
+    if odometry is not None:
+        print("   Not allocation-free: ground_odometry.py allocates its working arrays every frame "
+              "and they are counted above; set ODOMETRY = False to measure the pooled loop alone.")
+    if MOTION_GATING and frame_id > 0:
+        print(f"Motion gating: {gated_count}/{frame_id} frames reused the previous output "
+              f"({gated_count / frame_id * 100:.1f}%), threshold {MOTION_THRESHOLD}.")
+    if odometry is not None:
+        print(f"Odometry: {np.hypot(*odometry.position_cm) / 100:.2f} m travelled, "
+              f"heading change {odometry.heading_deg:.1f} deg (odometry.csv).")
+    if OUTPUT_MODE == "grid":
+        print(f"Done. Grids saved to '{OUTPUT_FRAMES_DIR}/' ({exported_count} arrays, {grid_width}x{grid_height} uint8, every {FRAME_EXPORT_EVERY}th frame).")
+    else:
+        print(f"Done. Frames saved to '{OUTPUT_FRAMES_DIR}/' ({exported_count} images, {canvas_width}x{canvas_height}, every {FRAME_EXPORT_EVERY}th frame).")
 
 
 if __name__ == "__main__":
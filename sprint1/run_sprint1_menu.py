@@ -3,6 +3,8 @@ import sys
 import subprocess
 import time
 
+import pipeline_runner
+
 def clear_terminal():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -16,14 +18,13 @@ def print_header():
     print(f"Working Directory: {os.getcwd()}")
     print_separator()
 
-def run_script(script_name, verification_text, automated_mode=False):
+def run_script(script_name, verification_text):
     """
     Executes a script and prints the 'Verification' instructions first.
     """
     if not os.path.exists(script_name):
         print(f"\n[ERROR] File '{script_name}' not found.")
-        if not automated_mode:
-            input("\nPress Enter to return to the menu...")
+        input("\nPress Enter to return to the menu...")
         return
 
     # --- VERIFICATION BLOCK ---
@@ -33,11 +34,7 @@ def run_script(script_name, verification_text, automated_mode=False):
     print(f"   {verification_text}")
     print("=" * 75)
     
-    if not automated_mode:
-        input("Press Enter to run...")
-    else:
-        print("Running in 2 seconds...")
-        time.sleep(2)
+    input("Press Enter to run...")
     
     # Run the script
     start_time = time.time()
@@ -45,7 +42,6 @@ def run_script(script_name, verification_text, automated_mode=False):
         subprocess.run([sys.executable, script_name], check=False)
     except KeyboardInterrupt:
         print("\n[WARNING] Process interrupted by user.")
-        if automated_mode: return False
     except Exception as e:
         print(f"\n[ERROR] {e}")
     
@@ -53,11 +49,7 @@ def run_script(script_name, verification_text, automated_mode=False):
     print("-" * 75)
     print(f"[STATUS] Finished in {elapsed:.2f} seconds.")
     
-    if not automated_mode:
-        input("Press Enter to return to the menu...")
-    else:
-        print("Next step in 3 seconds... (Ctrl+C to stop)")
-        time.sleep(3)
+    input("Press Enter to return to the menu...")
     
     return True
 
@@ -119,7 +111,8 @@ def main():
             print("") 
         
         print("-" * 30)
-        print(" 9. RUN ALL (Execute Steps 1-7 Sequentially)")
+        print(" 8. RUN ALL, FORCED (Rerun Steps 1-7 even if up to date)")
+        print(" 9. RUN ALL (Steps 1-7 in one process; skips up-to-date steps)")
         print("-" * 30)
         print(" Q. Quit")
         print_separator()
@@ -129,11 +122,12 @@ def main():
         if choice == 'q':
             break
         
-        if choice == '9':
+        if choice in ('8', '9'):
             print("\n[START] STARTING FULL SEQUENCE...")
-            time.sleep(1)
-            for title, filename, desc, verify in scripts:
-                if not run_script(filename, verify, automated_mode=True): break
+            verify_texts = {filename: verify for title, filename, desc, verify in scripts}
+            report = pipeline_runner.run_pipeline(force=(choice == '8'), verify_texts=verify_texts)
+            pipeline_runner.print_report(report)
+            input("\nPress Enter to return to the menu...")
             continue
 
         if choice.isdigit():
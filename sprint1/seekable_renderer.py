@@ -0,0 +1,308 @@
+"""
+Random-access rendering of the road video.
+
+A video decoder can only start at a keyframe, so showing frame N by reading
+from the start costs N decodes. SeekableRenderer builds a keyframe and
+timestamp index of the video once (a packet scan, no decoding), seeks straight
+to the nearest keyframe at or before any requested frame or time, decodes
+forward from there, and keeps an LRU cache of the rendered frames. The index is
+cached next to the video and rebuilt when the file changes.
+
+Run directly to time random access against decoding from the start.
+"""
+
+import bisect
+import os
+import pickle
+import sys
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import canvas_layout
+import geometry
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+VIDEO_PATH = "road_test.mp4"
+
+# The index is saved as <video><INDEX_SUFFIX>
+INDEX_SUFFIX = ".index.pkl"
+
+# Bumped when scan_video_index() changes; indexes saved by an older scan are rebuilt
+INDEX_VERSION = 2
+
+# Rendered frames kept in memory
+CACHE_FRAMES = 64
+
+# When a request moves backwards, also cache this many frames before it; they
+# are decoded on the way anyway and make stepping backwards cheap
+PREFILL_BEHIND = 8
+
+# Random frames requested by the timing run in main()
+BENCH_REQUESTS = 20
+
+
+def scan_video_index(video_path):
+    """
+    Keyframes and timestamps of every frame, read from the packets only.
+
+    Uses OpenCV's raw-stream mode (FFmpeg backend). Packets come in decode
+    order, which differs from display order when the stream has B-frames, so
+    they are sorted by timestamp. If the packet timestamps are not distinct
+    (e.g. missing PTS in an MPEG program stream) or the backend cannot report
+    keyframes, the frames are decoded once for their timestamps instead, every
+    frame is listed as a keyframe and seeking is left to the backend's own
+    keyframe search.
+    """
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+    if cap.isOpened():
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        packets = []   # (timestamp_ms, is_keyframe) in decode order
+        while cap.grab():
+            packets.append((cap.get(cv2.CAP_PROP_POS_MSEC),
+                            bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))))
+        cap.release()
+
+        # Stable sort into display order, so frame indices and the bisect in
+        # frame_at_time match what the decoder shows
+        packets.sort(key=lambda packet: packet[0])
+        timestamps_ms = [ts for ts, _ in packets]
+        keyframes = [i for i, (_, is_key) in enumerate(packets) if is_key]
+        distinct = all(a < b for a, b in zip(timestamps_ms, timestamps_ms[1:]))
+        if keyframes and distinct:
+            return {"fps": fps, "keyframes": keyframes, "timestamps_ms": timestamps_ms}
+
+    # Decode scan: the decoder returns frames in display order
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    timestamps_ms = []
+    while cap.grab():
+        timestamps_ms.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+    cap.release()
+    return {"fps": fps, "keyframes": list(range(len(timestamps_ms))),
+            "timestamps_ms": timestamps_ms}
+
+
+def load_video_index(video_path, rebuild=False):
+    """Cached scan_video_index(); rebuilt when the video's size or mtime changes."""
+    st = os.stat(video_path)
+    signature = (st.st_size, st.st_mtime_ns, INDEX_VERSION)
+    index_path = video_path + INDEX_SUFFIX
+
+    if not rebuild and os.path.isfile(index_path):
+        with open(index_path, "rb") as f:
+            index = pickle.load(f)
+        if index.get("signature") == signature:
+            return index
+
+    index = scan_video_index(video_path)
+    if index is None:
+        return None
+    index["signature"] = signature
+    with open(index_path, "wb") as f:
+        pickle.dump(index, f)
+    return index
+
+
+class SeekableRenderer:
+    """
+    Random access to the rendered frames of one video.
+
+    transform(frame, index) turns a decoded BGR frame into the image to keep
+    (it must return a new array; the decode buffer is reused). Without a
+    transform the decoded frame itself is cached.
+    """
+
+    def __init__(self, video_path, transform=None, cache_frames=CACHE_FRAMES,
+                 prefill_behind=PREFILL_BEHIND):
+        self.index = load_video_index(video_path)
+        if self.index is None:
+            raise IOError(f"Could not open '{video_path}'.")
+        self.cap = cv2.VideoCapture(video_path)
+        self.transform = transform
+        self.cache_frames = cache_frames
+        self.prefill_behind = prefill_behind
+        self.cache = OrderedDict()
+
+        self.frame_count = len(self.index["timestamps_ms"])
+        self.fps = self.index["fps"]
+        self.frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                           int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self._frame = np.zeros((self.frame_size[1], self.frame_size[0], 3), np.uint8)
+        # Index of the frame the next read() returns
+        self._position = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.seeks = 0
+        self.decoded = 0
+
+    def keyframe_before(self, frame_index):
+        keyframes = self.index["keyframes"]
+        return keyframes[max(0, bisect.bisect_right(keyframes, frame_index) - 1)]
+
+    def frame_at_time(self, seconds):
+        """Index of the frame shown at a given time."""
+        i = bisect.bisect_right(self.index["timestamps_ms"], seconds * 1000.0) - 1
+        return min(max(i, 0), self.frame_count - 1)
+
+    def get(self, frame_index):
+        """
+        Rendered frame at an index (clamped to the video), from cache if possible.
+
+        Returns None if the frame cannot be decoded (e.g. a truncated file).
+        """
+        frame_index = min(max(int(frame_index), 0), self.frame_count - 1)
+        if frame_index in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(frame_index)
+            return self.cache[frame_index]
+        self.misses += 1
+        return self._decode_to(frame_index)
+
+    def get_at_time(self, seconds):
+        return self.get(self.frame_at_time(seconds))
+
+    def _store(self, frame_index, image):
+        self.cache[frame_index] = image
+        self.cache.move_to_end(frame_index)
+        while len(self.cache) > self.cache_frames:
+            self.cache.popitem(last=False)
+
+    def _render(self, frame_index):
+        if self.transform is None:
+            return self._frame.copy()
+        return self.transform(self._frame, frame_index)
+
+    def _decode_to(self, frame_index):
+        """Decode up to frame_index (left in self._frame), render and cache it."""
+        if not self._advance_to(frame_index):
+            return None
+        image = self._render(frame_index)
+        self._store(frame_index, image)
+        return image
+
+    def _advance_to(self, frame_index):
+        """Decode up to frame_index into self._frame; False if it was not reached."""
+        key = self.keyframe_before(frame_index)
+        backwards = frame_index < self._position
+        # Decode straight on when no keyframe lies between here and the target
+        if not (key <= self._position <= frame_index):
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, key)
+            self._position = key
+            self.seeks += 1
+
+        first_kept = frame_index - self.prefill_behind if backwards else frame_index
+        while self._position <= frame_index:
+            i = self._position
+            keep = i == frame_index or (i >= first_kept and i not in self.cache)
+            # grab() decodes; only frames we keep are converted to BGR
+            ok = self.cap.grab() and (not keep or self.cap.retrieve(self._frame)[0])
+            if not ok:
+                # The decoder position is unknown now; seek on the next request
+                self._position = -1
+                return False
+            self._position += 1
+            self.decoded += 1
+            if keep and i != frame_index:
+                self._store(i, self._render(i))
+        return True
+
+    def frame(self, frame_index):
+        """Decoded frame at an index, before the transform (not cached); None on failure."""
+        frame_index = min(max(int(frame_index), 0), self.frame_count - 1)
+        if not self._advance_to(frame_index):
+            return None
+        return self._frame.copy()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "seeks": self.seeks,
+                "decoded": self.decoded, "cached": len(self.cache)}
+
+    def report(self):
+        s = self.stats()
+        return (f"Renderer: {s['hits']} cache hits, {s['misses']} misses, {s['seeks']} seeks, "
+                f"{s['decoded']} frames decoded, {s['cached']} cached.")
+
+    def close(self):
+        self.cap.release()
+        self.cache.clear()
+
+
+def birdseye_transform(data, frame_size, layout=None):
+    """transform() for SeekableRenderer that renders the bird's-eye canvas."""
+    if layout is None:
+        layout = canvas_layout.compute_canvas_layout(data, frame_size)
+    canvas_size = (layout["width"], layout["height"])
+    map1, map2, _ = geometry.build_birdseye_maps(
+        data, canvas_layout.layout_homography(data, layout), canvas_size, frame_size
+    )
+
+    def transform(frame, frame_index):
+        return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+    return transform
+
+
+def main():
+    try:
+        data = geometry.load_pipeline()
+    except FileNotFoundError:
+        print(f"Error: '{geometry.PIPELINE_PATH}' not found. Run Step 3 first.")
+        sys.exit()
+    if not os.path.isfile(VIDEO_PATH):
+        print(f"Error: '{VIDEO_PATH}' not found.")
+        sys.exit()
+
+    t0 = time.time()
+    index = load_video_index(VIDEO_PATH, rebuild=True)
+    keyframes = index["keyframes"]
+    print(f"Indexed {len(index['timestamps_ms'])} frames in {time.time() - t0:.2f} s: "
+          f"{len(keyframes)} keyframes (average gap {len(index['timestamps_ms']) / len(keyframes):.1f} frames).")
+
+    frame_size = geometry.video_frame_size(VIDEO_PATH)
+    renderer = SeekableRenderer(VIDEO_PATH, birdseye_transform(data, frame_size))
+    rng = np.random.default_rng(0)
+    requests = rng.integers(0, renderer.frame_count, BENCH_REQUESTS)
+
+    # Random access through the index
+    t0 = time.time()
+    for i in requests:
+        renderer.get(i)
+    seek_ms = (time.time() - t0) / len(requests) * 1000
+
+    # The same frames again (cache), then a backward scrub
+    t0 = time.time()
+    for i in requests:
+        renderer.get(i)
+    cached_ms = (time.time() - t0) / len(requests) * 1000
+    t0 = time.time()
+    start = renderer.frame_count - 1
+    for i in range(start, max(-1, start - 30), -1):
+        renderer.get(i)
+    back_ms = (time.time() - t0) / min(30, renderer.frame_count) * 1000
+    print(renderer.report())
+
+    # Reference: decode from the start for every request, as stepping did
+    t0 = time.time()
+    for i in requests[:5]:
+        cap = cv2.VideoCapture(VIDEO_PATH)
+        for _ in range(int(i) + 1):
+            cap.grab()
+        cap.release()
+    from_start_ms = (time.time() - t0) / min(5, len(requests)) * 1000
+    renderer.close()
+
+    print(f"Random frame (seek to keyframe): {seek_ms:.1f} ms")
+    print(f"Random frame (cached):           {cached_ms:.2f} ms")
+    print(f"Step backwards:                  {back_ms:.1f} ms per frame")
+    print(f"Decode from start (no render):   {from_start_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+Synthetic calibration and homography test bench.
+
+Renders checkerboard photos from a known camera (K, distortion) and known
+board poses at the project's 9x6 pattern and 3358x1884 resolution, runs them
+through the detection and calibration code of calibrate_camera.py and the
+homography code of calculate_homography.py, and reports the error against
+ground truth together with wall time. Use it to check that a faster path
+still meets the accuracy targets below.
+
+It also renders a textured road from the dashboard pose, turns the vehicle by
+known angles about the camera foot point and checks the yaw measured by
+ground_odometry.py.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import numpy as np
+
+import calculate_homography
+import calibrate_camera
+import geometry
+import ground_odometry
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+IMAGE_W, IMAGE_H = 3358, 1884
+TRUE_K = np.array([
+    [2900.0, 0.0, 1690.0],
+    [0.0, 2890.0, 930.0],
+    [0.0, 0.0, 1.0],
+])
+TRUE_DIST = np.array([0.12, -0.35, 0.001, -0.0008, 0.25])
+
+NUM_CALIB_VIEWS = 13
+RANDOM_SEED = 7
+
+# Rendering: board texture resolution, optical blur and sensor noise
+TEXTURE_PX_PER_UNIT = 4
+BLUR_SIGMA = 0.8
+NOISE_STD = 2.0
+JPEG_QUALITY = 95
+
+# Ground scene for the homography: camera height and distance to the board (cm)
+CAMERA_HEIGHT_CM = 140.0
+BOARD_DISTANCE_CM = 300.0
+
+# Accuracy targets the bench checks against
+MAX_FOCAL_ERROR_PCT = 1.0
+MAX_PRINCIPAL_ERROR_PX = 10.0
+MAX_UNDISTORT_ERROR_PX = 1.0
+MAX_SCALE_ERROR_PCT = 1.0
+MAX_GROUND_ERROR_CM = 1.0
+
+# Odometry: road texture grain (cm), the turns checked (deg per frame, positive
+# to the left) and the targets
+ROAD_GRAIN_CM = 3.0
+ODOMETRY_YAWS_DEG = [0.1, 0.25, 0.5, 1.0, 2.0, -0.25, -0.5]
+MAX_YAW_ERROR_DEG = 0.05
+MAX_FOOT_ERROR_CM = 0.5
+
+# Detection modes of calibrate_camera.py to compare
+DETECTION_MODES = ["full", "coarse_to_fine"]
+
+
+def distorted_pixel_rays(K, dist, size):
+    """Normalized undistorted coordinates (x, y) of every pixel of the raw image."""
+    w, h = size
+    xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+    pts = np.stack([xs.ravel(), ys.ravel()], axis=1).reshape(-1, 1, 2)
+    norm = cv2.undistortPoints(pts, K, dist).reshape(h, w, 2)
+    return norm[..., 0], norm[..., 1]
+
+
+def board_texture(dims, square, px_per_unit):
+    """Checkerboard with a one-square white margin; returns (image, origin_px)."""
+    cols, rows = dims[0] + 1, dims[1] + 1
+    sq_px = int(round(square * px_per_unit))
+    tex = np.full(((rows + 2) * sq_px, (cols + 2) * sq_px), 255, np.uint8)
+    for r in range(rows):
+        for c in range(cols):
+            if (r + c) % 2 == 0:
+                y0, x0 = (r + 1) * sq_px, (c + 1) * sq_px
+                tex[y0:y0 + sq_px, x0:x0 + sq_px] = 0
+    # The first inner corner sits two squares in from the texture edge
+    origin = 2 * sq_px - 0.5
+    return tex, origin, sq_px / square
+
+
+def render_view(rays, R, t, dims, square, rng):
+    """Render the board seen from pose (R, t); background is mid grey."""
+    tex, origin, scale = board_texture(dims, square, TEXTURE_PX_PER_UNIT)
+    Hb = np.column_stack([R[:, 0], R[:, 1], t])
+    Hinv = np.linalg.inv(Hb)
+    x, y = rays
+    X = Hinv[0, 0] * x + Hinv[0, 1] * y + Hinv[0, 2]
+    Y = Hinv[1, 0] * x + Hinv[1, 1] * y + Hinv[1, 2]
+    W = Hinv[2, 0] * x + Hinv[2, 1] * y + Hinv[2, 2]
+    map_x = (X / W * scale + origin).astype(np.float32)
+    map_y = (Y / W * scale + origin).astype(np.float32)
+    map_x[W <= 0] = -1
+    img = cv2.remap(tex, map_x, map_y, cv2.INTER_LINEAR,
+                    borderMode=cv2.BORDER_CONSTANT, borderValue=128)
+    img = cv2.GaussianBlur(img, (0, 0), BLUR_SIGMA)
+    noisy = img.astype(np.float32) + rng.normal(0, NOISE_STD, img.shape).astype(np.float32)
+    return cv2.cvtColor(np.clip(noisy, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def look_at(center, target, down):
+    """World-to-camera rotation for a camera at center looking at target."""
+    f = target - center
+    f /= np.linalg.norm(f)
+    x = np.cross(down, f)
+    x /= np.linalg.norm(x)
+    y = np.cross(f, x)
+    return np.vstack([x, y, f])
+
+
+def calibration_poses(rng, count, dims, square):
+    """Board poses that keep the whole board inside the frame at varied tilts."""
+    board_center = np.array([(dims[0] - 1) * square / 2, (dims[1] - 1) * square / 2, 0.0])
+    poses = []
+    while len(poses) < count:
+        distance = rng.uniform(450, 800)
+        tilt_x, tilt_y = np.radians(rng.uniform(-35, 35, size=2))
+        center = board_center + distance * np.array([
+            np.sin(tilt_y), np.sin(tilt_x), -np.cos(tilt_x) * np.cos(tilt_y)
+        ])
+        target = board_center + np.array([rng.uniform(-250, 250), rng.uniform(-140, 140), 0])
+        R = look_at(center, target, np.array([0.0, 1.0, 0.0]))
+        roll = np.radians(rng.uniform(-15, 15))
+        Rz = np.array([[np.cos(roll), -np.sin(roll), 0], [np.sin(roll), np.cos(roll), 0], [0, 0, 1]])
+        R = Rz @ R
+        t = -R @ center
+
+        # Keep the board (with its margin) well inside the image
+        corners = np.array([[-2 * square, -2 * square, 0], [(dims[0] + 1) * square, -2 * square, 0],
+                            [(dims[0] + 1) * square, (dims[1] + 1) * square, 0],
+                            [-2 * square, (dims[1] + 1) * square, 0]], dtype=np.float64)
+        img_pts, _ = cv2.projectPoints(corners, cv2.Rodrigues(R)[0], t, TRUE_K, TRUE_DIST)
+        img_pts = img_pts.reshape(-1, 2)
+        if (img_pts[:, 0].min() > 50 and img_pts[:, 0].max() < IMAGE_W - 50
+                and img_pts[:, 1].min() > 50 and img_pts[:, 1].max() < IMAGE_H - 50):
+            poses.append((R, t))
+    return poses
+
+
+def undistortion_error(mtx, dist, imgpoints):
+    """
+    Pixel error of the estimated lens model: undistort a pixel grid with the
+    estimate and project it back with the true model. Coefficients trade off
+    against each other, so this is the number that matters for the bird's-eye
+    view. Returns (max inside the area the boards covered, max over the frame);
+    outside the covered area the model is an extrapolation.
+    """
+    xs, ys = np.meshgrid(np.linspace(0, IMAGE_W - 1, 40), np.linspace(0, IMAGE_H - 1, 24))
+    pts = np.column_stack([xs.ravel(), ys.ravel()]).reshape(-1, 1, 2)
+    norm = cv2.undistortPoints(pts, mtx, dist).reshape(-1, 2)
+    obj = np.column_stack([norm, np.ones(len(norm))])
+    back, _ = cv2.projectPoints(obj, np.zeros(3), np.zeros(3), TRUE_K, TRUE_DIST)
+    err = np.linalg.norm(back.reshape(-1, 2) - pts.reshape(-1, 2), axis=1)
+
+    hull = cv2.convexHull(np.concatenate(imgpoints).reshape(-1, 2).astype(np.float32))
+    covered = np.array([cv2.pointPolygonTest(hull, (float(x), float(y)), False) >= 0
+                        for x, y in pts.reshape(-1, 2)])
+    return float(err[covered].max()), float(err.max())
+
+
+def bench_calibration(rays, rng):
+    """Render calibration photos, run every detection mode, compare with truth."""
+    dims, square = calibrate_camera.CHECKERBOARD_DIMS, calibrate_camera.SQUARE_SIZE
+    folder = tempfile.mkdtemp(prefix="synthetic_calib_")
+    t0 = time.time()
+    names = []
+    for i, (R, t) in enumerate(calibration_poses(rng, NUM_CALIB_VIEWS, dims, square)):
+        name = os.path.join(folder, f"synthetic_{i:02d}.jpg")
+        cv2.imwrite(name, render_view(rays, R, t, dims, square, rng),
+                    [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        names.append(name)
+    print(f"Rendered {len(names)} calibration views in {time.time() - t0:.1f} s.")
+
+    results = {}
+    objp = calibrate_camera.board_object_points()
+    for mode in DETECTION_MODES:
+        t0 = time.time()
+        imgpoints, found, image_size = [], [], None
+        for name in names:
+            corners, size = calibrate_camera.detect_image(name, mode)
+            if corners is not None:
+                imgpoints.append(corners)
+                found.append(name)
+                image_size = size
+        detect_s = time.time() - t0
+
+        t0 = time.time()
+        rms, mtx, dist, kept, _ = calibrate_camera.calibrate_with_outlier_rejection(
+            [objp] * len(imgpoints), imgpoints, found, image_size
+        )
+        calib_s = time.time() - t0
+        covered_err, frame_err = undistortion_error(mtx, dist, imgpoints)
+
+        results[mode] = {
+            "found": len(found),
+            "kept": len(kept),
+            "rms_px": rms,
+            "mtx": mtx,
+            "dist": dist.ravel(),
+            "fx_err_pct": abs(mtx[0, 0] / TRUE_K[0, 0] - 1) * 100,
+            "fy_err_pct": abs(mtx[1, 1] / TRUE_K[1, 1] - 1) * 100,
+            "pp_err_px": float(np.hypot(mtx[0, 2] - TRUE_K[0, 2], mtx[1, 2] - TRUE_K[1, 2])),
+            "dist_err": np.abs(dist.ravel()[:5] - TRUE_DIST),
+            "undistort_err_px": covered_err,
+            "undistort_frame_err_px": frame_err,
+            "detect_ms_per_image": detect_s / len(names) * 1000,
+            "calibrate_s": calib_s,
+        }
+
+    shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def bench_homography(rays, rng, mtx, dist):
+    """
+    Render a board lying on the road, run the calculate_homography.py steps
+    with the estimated calibration and measure the metric error of the map.
+    """
+    dims = calculate_homography.CHECKERBOARD_DIMS
+    square = calculate_homography.SQUARE_SIZE_CM
+    ppc = calculate_homography.PIXELS_PER_CM
+    board_center = np.array([(dims[0] - 1) * square / 2, (dims[1] - 1) * square / 2, 0.0])
+
+    # Ground plane is z = 0, the camera sits above it (negative z is "up")
+    center = board_center + np.array([0.0, BOARD_DISTANCE_CM, -CAMERA_HEIGHT_CM])
+    target = board_center + np.array([0.0, -BOARD_DISTANCE_CM * 0.3, 0.0])
+    R = look_at(center, target, np.array([0.0, 0.0, 1.0]))
+    t = -R @ center
+    img = render_view(rays, R, t, dims, square, rng)
+
+    t0 = time.time()
+    undistorted, newcameramtx = calculate_homography.undistort_setup_image(img, mtx, dist)
+    x_start, x_end, y_start, y_end = calculate_homography.crop_bounds(IMAGE_W, IMAGE_H)
+    gray_crop = cv2.cvtColor(undistorted[y_start:y_end, x_start:x_end], cv2.COLOR_BGR2GRAY)
+    corners = calculate_homography.detect_board(gray_crop, verbose=False)
+    if corners is None:
+        return None
+    corners[:, :, 0] += x_start
+    corners[:, :, 1] += y_start
+    H = calculate_homography.compute_homography(corners)
+    elapsed = time.time() - t0
+
+    # The detector may list the corners from the opposite end of the board
+    first_true, _ = cv2.projectPoints(np.zeros((1, 3)), cv2.Rodrigues(R)[0], t, TRUE_K, TRUE_DIST)
+    first_true = cv2.undistortPoints(first_true, mtx, dist, P=newcameramtx).reshape(2)
+    reversed_order = (np.linalg.norm(corners[-1, 0] - first_true)
+                      < np.linalg.norm(corners[0, 0] - first_true))
+
+    # Ground truth points on and around the board (cm), through the real camera
+    gx, gy = np.meshgrid(np.linspace(-50, 80, 14), np.linspace(-50, 60, 12))
+    ground = np.column_stack([gx.ravel(), gy.ravel(), np.zeros(gx.size)])
+    raw, _ = cv2.projectPoints(ground, cv2.Rodrigues(R)[0], t, TRUE_K, TRUE_DIST)
+    undist = cv2.undistortPoints(raw, mtx, dist, P=newcameramtx)
+    mapped = cv2.perspectiveTransform(undist, H).reshape(-1, 2)
+
+    far_x, far_y = (dims[0] - 1) * square, (dims[1] - 1) * square
+    expected_xy = ground[:, :2] if not reversed_order else np.column_stack(
+        [far_x - ground[:, 0], far_y - ground[:, 1]])
+    expected = np.array([calculate_homography.MAP_OFFSET_X, calculate_homography.MAP_OFFSET_Y]) + expected_xy * ppc
+    err_cm = np.linalg.norm(mapped - expected, axis=1) / ppc
+
+    on_board = ((ground[:, 0] >= 0) & (ground[:, 0] <= far_x)
+                & (ground[:, 1] >= 0) & (ground[:, 1] <= far_y))
+
+    # Scale: px per cm measured along both board axes
+    ends = np.array([[0, 0, 0], [far_x, 0, 0], [0, far_y, 0]], dtype=np.float64)
+    raw_ends, _ = cv2.projectPoints(ends, cv2.Rodrigues(R)[0], t, TRUE_K, TRUE_DIST)
+    map_ends = cv2.perspectiveTransform(
+        cv2.undistortPoints(raw_ends, mtx, dist, P=newcameramtx), H).reshape(-1, 2)
+    scale_x = np.linalg.norm(map_ends[1] - map_ends[0]) / far_x
+    scale_y = np.linalg.norm(map_ends[2] - map_ends[0]) / far_y
+    return {
+        "cm_per_px": (1 / scale_x, 1 / scale_y),
+        "scale_err_pct": max(abs(scale_x / ppc - 1), abs(scale_y / ppc - 1)) * 100,
+        "board_err_cm": float(np.sqrt(np.mean(err_cm[on_board] ** 2))),
+        "area_err_cm": float(np.sqrt(np.mean(err_cm ** 2))),
+        "max_err_cm": float(err_cm.max()),
+        "seconds": elapsed,
+    }
+
+
+def bench_odometry(rays, rng):
+    """
+    Turn the vehicle by known angles about the camera foot point and compare
+    the yaw measured by ground_odometry.py; a pure turn should also leave the
+    foot point where it is.
+
+    Uses the true camera (same dashboard pose as the homography scene), so
+    only the odometry is tested.
+    """
+    board_center = np.zeros(3)
+    center = board_center + np.array([0.0, BOARD_DISTANCE_CM, -CAMERA_HEIGHT_CM])
+    R = look_at(center, board_center, np.array([0.0, 0.0, 1.0]))
+    t = -R @ center
+
+    # True pipeline: undistorted pixels (new camera matrix = K) -> map pixels
+    ppc = geometry.PIXELS_PER_CM
+    to_map = np.array([[ppc, 0, calculate_homography.MAP_OFFSET_X],
+                       [0, ppc, calculate_homography.MAP_OFFSET_Y], [0, 0, 1]], dtype=np.float64)
+    H = to_map @ np.linalg.inv(TRUE_K @ np.column_stack([R[:, 0], R[:, 1], t]))
+    data = {"camera_matrix": TRUE_K, "dist_coeff": TRUE_DIST, "homography_matrix": H}
+
+    # Ground point (cm) seen by every raw pixel
+    Hinv = np.linalg.inv(np.column_stack([R[:, 0], R[:, 1], t]))
+    x, y = rays
+    W = Hinv[2, 0] * x + Hinv[2, 1] * y + Hinv[2, 2]
+    X = (Hinv[0, 0] * x + Hinv[0, 1] * y + Hinv[0, 2]) / W
+    Y = (Hinv[1, 0] * x + Hinv[1, 1] * y + Hinv[1, 2]) / W
+    foot = center[:2]
+
+    # Road texture: smoothed noise, 1 texel per cm, centred on the foot point
+    size = 2048
+    texture = rng.normal(128, 50, (size // 4, size // 4)).astype(np.float32)
+    texture = cv2.GaussianBlur(cv2.resize(texture, (size, size), interpolation=cv2.INTER_CUBIC),
+                               (0, 0), ROAD_GRAIN_CM / 2)
+    texture = np.clip(texture, 0, 255).astype(np.uint8)
+
+    # A left turn moves the viewing direction towards the camera's left
+    forward, left = R[2, :2], -R[0, :2]
+    turn_sign = 1.0 if forward[0] * left[1] - forward[1] * left[0] > 0 else -1.0
+
+    def render(yaw_deg):
+        a = np.radians(yaw_deg) * turn_sign
+        c, s = np.cos(a), np.sin(a)
+        gx, gy = X - foot[0], Y - foot[1]
+        map_x = (c * gx - s * gy + size / 2).astype(np.float32)
+        map_y = (s * gx + c * gy + size / 2).astype(np.float32)
+        map_x[W <= 0] = -1
+        img = cv2.remap(texture, map_x, map_y, cv2.INTER_LINEAR,
+                        borderMode=cv2.BORDER_CONSTANT, borderValue=128)
+        img = cv2.GaussianBlur(img, (0, 0), BLUR_SIGMA)
+        noisy = img.astype(np.float32) + rng.normal(0, NOISE_STD, img.shape).astype(np.float32)
+        return cv2.cvtColor(np.clip(noisy, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+    odometry = ground_odometry.GroundOdometry(data, (IMAGE_W, IMAGE_H), 30.0)
+    straight = render(0.0)
+    results = []
+    for yaw in ODOMETRY_YAWS_DEG:
+        odometry.update(straight, 1)
+        t0 = time.time()
+        row = odometry.update(render(yaw), 2)
+        results.append({
+            "yaw": yaw,
+            "measured": row["yaw_deg"],
+            "foot_err_cm": float(np.hypot(row["side_cm"], row["forward_cm"])),
+            "seconds": time.time() - t0,
+        })
+    return results
+
+
+def verdict(ok):
+    return "PASS" if ok else "FAIL"
+
+
+def main():
+    rng = np.random.default_rng(RANDOM_SEED)
+    print(f"Synthetic bench: {IMAGE_W}x{IMAGE_H}, board {calibrate_camera.CHECKERBOARD_DIMS}, "
+          f"{NUM_CALIB_VIEWS} calibration views.")
+
+    t0 = time.time()
+    rays = distorted_pixel_rays(TRUE_K, TRUE_DIST, (IMAGE_W, IMAGE_H))
+    print(f"Precomputed pixel rays in {time.time() - t0:.1f} s.")
+
+    calib = bench_calibration(rays, rng)
+    print("\n--- CALIBRATION (calibrate_camera.py) ---")
+    print(f"{'mode':<16}{'found':>6}{'kept':>6}{'rms px':>8}{'fx %':>8}{'fy %':>8}"
+          f"{'pp px':>8}{'ms/img':>9}{'calib s':>9}")
+    for mode, r in calib.items():
+        print(f"{mode:<16}{r['found']:>6}{r['kept']:>6}{r['rms_px']:>8.3f}{r['fx_err_pct']:>8.3f}"
+              f"{r['fy_err_pct']:>8.3f}{r['pp_err_px']:>8.2f}{r['detect_ms_per_image']:>9.0f}"
+              f"{r['calibrate_s']:>9.2f}")
+    for mode, r in calib.items():
+        print(f"   {mode} distortion |error|: {np.array2string(r['dist_err'], precision=4)}, "
+              f"undistortion error {r['undistort_err_px']:.3f} px in the covered area "
+              f"({r['undistort_frame_err_px']:.1f} px at the frame corners)")
+        ok = (max(r["fx_err_pct"], r["fy_err_pct"]) <= MAX_FOCAL_ERROR_PCT
+              and r["pp_err_px"] <= MAX_PRINCIPAL_ERROR_PX
+              and r["undistort_err_px"] <= MAX_UNDISTORT_ERROR_PX)
+        print(f"   {mode}: {verdict(ok)} (focal <= {MAX_FOCAL_ERROR_PCT}%, "
+              f"principal point <= {MAX_PRINCIPAL_ERROR_PX} px, "
+              f"undistortion <= {MAX_UNDISTORT_ERROR_PX} px)")
+
+    print("\n--- HOMOGRAPHY (calculate_homography.py) ---")
+    for mode, r in calib.items():
+        h = bench_homography(rays, rng, r["mtx"], r["dist"])
+        if h is None:
+            print(f"   {mode}: board not detected in the ground scene. {verdict(False)}")
+            continue
+        ok = h["scale_err_pct"] <= MAX_SCALE_ERROR_PCT and h["board_err_cm"] <= MAX_GROUND_ERROR_CM
+        print(f"   {mode}: cm/px = {h['cm_per_px'][0]:.4f} x {h['cm_per_px'][1]:.4f} "
+              f"(target {1 / calculate_homography.PIXELS_PER_CM:.4f}), scale error {h['scale_err_pct']:.2f}%")
+        print(f"      ground error: board RMS {h['board_err_cm']:.2f} cm, "
+              f"surroundings RMS {h['area_err_cm']:.2f} cm, max {h['max_err_cm']:.2f} cm, "
+              f"{h['seconds'] * 1000:.0f} ms. {verdict(ok)}")
+
+    print("\n--- ODOMETRY (ground_odometry.py) ---")
+    for r in bench_odometry(rays, rng):
+        ok = abs(r["measured"] - r["yaw"]) <= MAX_YAW_ERROR_DEG and r["foot_err_cm"] <= MAX_FOOT_ERROR_CM
+        print(f"   turn {r['yaw']:+.2f} deg: measured {r['measured']:+.3f} deg, "
+              f"foot point moved {r['foot_err_cm']:.2f} cm. {verdict(ok)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import numpy as np
 import pickle
 import sys
 
+import geometry
+
 # --- CONFIGURATION ---
 VIDEO_PATH = 'road_test.mp4'  # <--- REPLACE with your video filename
 OUTPUT_FILENAME = 'sprint1_result.mp4'
@@ -37,6 +39,9 @@ map_w, map_h = 1000, 1500
 fourcc = cv2.VideoWriter_fourcc(*'mp4v')
 out = cv2.VideoWriter(OUTPUT_FILENAME, fourcc, fps, (map_w, map_h))
 
+# Undistort + warp folded into one remap; the tables are built once
+map1, map2, _ = geometry.build_birdseye_maps(data, H, (map_w, map_h), (width, height))
+
 print(f"Processing {total_frames} frames... Press 'q' to quit early.")
 
 frame_count = 0
@@ -46,14 +51,9 @@ while True:
     if not ret:
         break # End of video
 
-    # A. Undistort (Fix Lens Curvature)
-    # Optimization: We usually calculate newcameramtx once outside the loop, 
-    # but for simplicity, we do it here or use the standard undistort.
-    undistorted = cv2.undistort(frame, mtx, dist, None, mtx)
-
-    # B. Warp Perspective (Bird's-Eye View)
+    # A+B. Undistort (Fix Lens Curvature) and Warp (Bird's-Eye View) in one pass
     # Note: We use the same map_w, map_h as the video writer
-    warped = cv2.warpPerspective(undistorted, H, (map_w, map_h))
+    warped = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
 
     # C. Verification Overlays
     # Draw the 10cm scale line for proof
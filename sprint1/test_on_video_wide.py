@@ -2,12 +2,20 @@ import cv2
 import numpy as np
 import pickle
 import sys
+import time
+
+import canvas_layout
+import geometry
 
 # --- CONFIGURATION ---
 VIDEO_PATH = 'road_test.mp4'
 # Preview only: no file written. Show this many seconds then stop.
 PREVIEW_SECONDS = 5
 
+# Width of the on-screen view. Frames are warped straight to this size; press
+# 'p' to save the current frame at full canvas resolution instead.
+DISPLAY_W = 800
+
 # 1. Load the Video Pipeline
 try:
     with open("geometry_pipeline_video.pkl", "rb") as f:
@@ -23,6 +31,7 @@ except FileNotFoundError:
 cap = cv2.VideoCapture(VIDEO_PATH)
 fps = int(cap.get(cv2.CAP_PROP_FPS))
 if fps == 0: fps = 30 # Fallback
+frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
 
 # 2. SETUP THE WIDE CANVAS
 # A standard lane is ~3.5m (3500px). We need a canvas slightly larger.
@@ -34,23 +43,54 @@ MAP_H = 4000   # 4 meters long (scrolling)
 SHIFT_X = 1500  # Shift the road to the right by 1500 pixels
 SHIFT_Y = 0     # Shift down/up
 
-# Create a Translation Matrix to move the road into our new wide window
-Translation = np.array([
-    [1, 0, SHIFT_X],
-    [0, 1, SHIFT_Y],
-    [0, 0, 1]
-])
+# Or let canvas_layout.py size the canvas and shift from the road footprint
+AUTO_CANVAS = True
+
+if AUTO_CANVAS:
+    # Never larger than the hand-tuned canvas it replaces
+    layout = canvas_layout.compute_canvas_layout(data, frame_size, max_pixels=MAP_W * MAP_H)
+    MAP_W, MAP_H = layout["width"], layout["height"]
+    canvas_scale = layout["scale"]
+    H_final = canvas_layout.layout_homography(data, layout)
+    print(f"Auto canvas: {MAP_W}x{MAP_H} (range {layout['max_range_cm']:.0f} cm, "
+          f"{layout['pixels_per_cm']:.2f} px/cm)")
+else:
+    canvas_scale = 1.0
+    # Create a Translation Matrix to move the road into our new wide window
+    Translation = np.array([
+        [1, 0, SHIFT_X],
+        [0, 1, SHIFT_Y],
+        [0, 0, 1]
+    ])
+
+    # Combine with existing Homography
+    H_final = np.matmul(Translation, H)
+
+# 4. WARP STRAIGHT TO SCREEN SIZE
+# Undistort + warp + resize folded into one remap at display resolution
+display_scale = DISPLAY_W / MAP_W
+display_size = (DISPLAY_W, int(DISPLAY_W * MAP_H / MAP_W))
+H_display = geometry.scaled_homography(H_final, display_scale)
+map1, map2, _ = geometry.build_birdseye_maps(data, H_display, display_size, frame_size)
+
+
+def draw_scale_reference(img, scale):
+    # 100 px line = 10 cm on the full canvas
+    thickness = max(1, int(round(10 * scale)))
+    cv2.line(img, (int(100 * scale), int(100 * scale)), (int(200 * scale), int(100 * scale)),
+             (0, 0, 255), thickness)
+    cv2.putText(img, "10 cm (Actual Size)", (int(100 * scale), int(80 * scale)),
+                cv2.FONT_HERSHEY_SIMPLEX, max(0.4, 2.0 * scale), (0, 0, 255), max(1, int(round(5 * scale))))
 
-# Combine with existing Homography
-H_final = np.matmul(Translation, H)
 
 # Preview only: no file output
-out = None
 max_preview_frames = int(fps * PREVIEW_SECONDS)
 
-print(f"Preview only ({PREVIEW_SECONDS} s). Press 'q' to quit early.")
+print(f"Preview only ({PREVIEW_SECONDS} s) at {display_size[0]}x{display_size[1]}. "
+      f"Press 'p' for a full-resolution still, 'q' to quit early.")
 
 frame_count = 0
+start_time = time.time()
 while True:
     ret, frame = cap.read()
     if not ret:
@@ -59,32 +99,26 @@ while True:
     if frame_count > max_preview_frames:
         break
 
-    # A. Undistort
-    undistorted = cv2.undistort(frame, mtx, dist, None, mtx)
-
-    # B. Warp to Huge Canvas
-    warped = cv2.warpPerspective(undistorted, H_final, (MAP_W, MAP_H))
+    # A+B. Undistort and warp to the Mini-Map in one pass (For You)
+    display_view = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
 
     # C. Add Scale Reference (The "Truth")
-    # 100 px line = 10 cm
-    cv2.line(warped, (100, 100), (200, 100), (0, 0, 255), 10)
-    cv2.putText(warped, "10 cm (Actual Size)", (100, 80), 
-                cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 0, 255), 5)
-
-    # D. Save disabled (preview only)
-    if out is not None:
-        out.write(warped)
-
-    # E. Display a "Mini-Map" (For You)
-    # We resize the 4000px image down to 800px just so it fits on your screen
-    display_view = cv2.resize(warped, (800, 800))
+    draw_scale_reference(display_view, display_scale * canvas_scale)
     cv2.imshow('Sprint 1 Final: Full Road View', display_view)
 
-    if cv2.waitKey(1) & 0xFF == ord('q'):
+    key = cv2.waitKey(1) & 0xFF
+    if key == ord('q'):
         break
-
+    if key == ord('p'):
+        # Full canvas, rendered only on demand
+        still = geometry.render_still(data, frame, H_final, (MAP_W, MAP_H))
+        draw_scale_reference(still, canvas_scale)
+        still_name = f"still_wide_{frame_count:05d}.jpg"
+        cv2.imwrite(still_name, still)
+        print(f"Saved full-resolution still '{still_name}' ({MAP_W}x{MAP_H}).")
+
+elapsed = time.time() - start_time
 cap.release()
-if out is not None:
-    out.release()
 cv2.destroyAllWindows()
-print("Preview finished (no file saved).")
\ No newline at end of file
+if frame_count:
+    print(f"Preview finished (no file saved): {frame_count / elapsed:.1f} fps.")
@@ -0,0 +1,564 @@
+"""
+Local transform service that keeps pipelines warm between requests.
+
+Tools that need bird's-eye frames or metric positions otherwise each load the
+pipeline pickle and rebuild remap tables and metric lookup tables at startup.
+This service loads them once and answers batched requests over a Unix socket
+(or localhost TCP where Unix sockets are unavailable):
+
+    warp     - raw frames -> bird's-eye canvases. Frames are passed through
+               shared memory; only the block names travel over the socket.
+    points   - raw or undistorted pixels -> ground X, Y and range (cm),
+               answered from the metric lookup table.
+    describe - canvas size for a pipeline and frame size (builds the tables).
+    metrics  - throughput, queue depth and latency.
+
+Messages are a 4-byte length plus a JSON header, followed by an optional raw
+binary payload (point arrays). Requests are queued and served by a pool of
+worker threads; OpenCV releases the GIL while remapping.
+
+Usage:
+    python3 transform_service.py            # serve until Ctrl+C
+    python3 transform_service.py metrics    # print a running service's metrics
+    python3 transform_service.py bench      # time batched requests against it
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+import canvas_layout
+import geometry
+import metric_lookup
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+SOCKET_PATH = "/tmp/sprint1_transform.sock"
+# Used instead of the socket file when AF_UNIX is not available
+TCP_ADDRESS = ("127.0.0.1", 47631)
+
+# Pipelines served by name; clients that give no name get "default"
+PIPELINES = {"default": geometry.PIPELINE_PATH}
+
+WORKERS = 4
+
+# Latencies kept for the percentiles reported by "metrics"
+LATENCY_WINDOW = 1000
+
+# Used by "bench"
+VIDEO_PATH = "road_test.mp4"
+BENCH_BATCH = 8
+BENCH_POINTS = 10000
+
+HEADER = struct.Struct("!I")
+
+
+# -----------------------------------------------------------------------------
+# Wire format
+# -----------------------------------------------------------------------------
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0:
+            raise ConnectionError("connection closed")
+        got += k
+    return bytes(buf)
+
+
+def send_message(sock, header, payload=b""):
+    """Send a JSON header; header["payload_bytes"] tells the reader what follows."""
+    header = dict(header, payload_bytes=len(payload))
+    body = json.dumps(header).encode()
+    sock.sendall(HEADER.pack(len(body)) + body)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    """Returns (header, payload bytes)."""
+    (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    header = json.loads(_recv_exact(sock, size))
+    n = header.get("payload_bytes", 0)
+    return header, (_recv_exact(sock, n) if n else b"")
+
+
+def attach_shared_memory(name):
+    """
+    Open a block created by another process without taking ownership of it.
+
+    Before Python 3.13 attaching registers the block with this process's
+    resource tracker, which would unlink it when the service exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+# -----------------------------------------------------------------------------
+# Warm state
+# -----------------------------------------------------------------------------
+class WarmPipeline:
+    """One pipeline pickle with its remap tables and metric lookups, built on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = geometry.load_pipeline(path)
+        self._lock = threading.Lock()
+        self._canvases = {}
+        self._lookups = {}
+        # One lock per table being built, so each is built once
+        self._building = {}
+
+    def _cached(self, table, key, build):
+        """
+        table[key], calling build() the first time.
+
+        Building happens outside the shared lock, which only guards the dicts,
+        so requests for tables that are already built never wait for it.
+        """
+        with self._lock:
+            if key in table:
+                return table[key]
+            build_lock = self._building.setdefault((id(table), key), threading.Lock())
+        with build_lock:
+            with self._lock:
+                if key in table:
+                    return table[key]
+            value = build()
+            with self._lock:
+                table[key] = value
+                self._building.pop((id(table), key), None)
+            return value
+
+    def canvas(self, frame_size, max_range_cm=canvas_layout.MAX_RANGE_CM,
+               max_pixels=canvas_layout.MAX_CANVAS_PIXELS):
+        """Layout and remap tables for one frame size and canvas limit (max_pixels=None: no limit)."""
+        frame_size = tuple(frame_size)
+
+        def build():
+            layout = canvas_layout.compute_canvas_layout(
+                self.data, frame_size, max_range_cm=max_range_cm, max_pixels=max_pixels)
+            canvas_size = (layout["width"], layout["height"])
+            map1, map2, _ = geometry.build_birdseye_maps(
+                self.data, canvas_layout.layout_homography(self.data, layout), canvas_size, frame_size)
+            return layout, map1, map2
+        return self._cached(self._canvases, (frame_size, max_range_cm, max_pixels), build)
+
+    def lookup(self, frame_size):
+        frame_size = tuple(frame_size)
+        return self._cached(self._lookups, frame_size,
+                            lambda: metric_lookup.load_metric_lookup(self.data, frame_size))
+
+
+class Metrics:
+    """Counters and recent latencies; all methods are thread-safe."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.frames = 0
+        self.points = 0
+        self.in_flight = 0
+        self._latency = deque(maxlen=window)
+        self._wait = deque(maxlen=window)
+        self._done = deque(maxlen=window)   # (time, frames, points)
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, latency, wait, frames=0, points=0, ok=True):
+        now = time.time()
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += 0 if ok else 1
+            self.frames += frames
+            self.points += points
+            self._latency.append(latency)
+            self._wait.append(wait)
+            self._done.append((now, frames, points))
+
+    def snapshot(self, queue_depth):
+        with self._lock:
+            uptime = time.time() - self.started
+            latency = np.array(self._latency) * 1000 if self._latency else np.zeros(1)
+            wait = np.array(self._wait) * 1000 if self._wait else np.zeros(1)
+            span = (self._done[-1][0] - self._done[0][0]) if len(self._done) > 1 else 0.0
+            recent_frames = sum(d[1] for d in list(self._done)[1:])
+            recent_points = sum(d[2] for d in list(self._done)[1:])
+            return {
+                "uptime_s": uptime,
+                "requests": self.requests,
+                "errors": self.errors,
+                "frames": self.frames,
+                "points": self.points,
+                "in_flight": self.in_flight,
+                "queue_depth": queue_depth,
+                "latency_ms_p50": float(np.percentile(latency, 50)),
+                "latency_ms_p95": float(np.percentile(latency, 95)),
+                "latency_ms_max": float(latency.max()),
+                "queue_wait_ms_mean": float(wait.mean()),
+                "frames_per_s": recent_frames / span if span > 0 else 0.0,
+                "points_per_s": recent_points / span if span > 0 else 0.0,
+            }
+
+
+class TransformService:
+    """Request queue, worker threads and the warm pipelines they share."""
+
+    def __init__(self, pipelines=PIPELINES, workers=WORKERS):
+        self.pipelines = {name: WarmPipeline(path) for name, path in pipelines.items()
+                          if os.path.isfile(path)}
+        self.metrics = Metrics()
+        self.jobs = queue.Queue()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, header, payload, attached):
+        """
+        Queue one request and wait for its (header, payload) reply.
+
+        Frame batches are split into one part per worker so a single client
+        still uses every core; each part is its own job in the queue.
+        """
+        parts = [header]
+        if header.get("op") == "warp" and header["count"] > 1:
+            bounds = np.linspace(0, header["count"], min(header["count"], len(self._workers)) + 1)
+            bounds = bounds.astype(int)
+            parts = [dict(header, first=int(a), count=int(b - a)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+        queued = time.time()
+        self.metrics.begin()
+        jobs = [{"header": part, "payload": payload, "attached": attached,
+                 "done": threading.Event()} for part in parts]
+        for job in jobs:
+            self.jobs.put(job)
+        for job in jobs:
+            job["done"].wait()
+
+        failed = [job for job in jobs if not job["ok"]]
+        frames = sum(job["frames"] for job in jobs)
+        points = sum(job["points"] for job in jobs)
+        started = min(job["started"] for job in jobs)
+        self.metrics.end(time.time() - queued, started - queued, frames, points, not failed)
+        if failed:
+            return failed[0]["reply"]
+        if len(jobs) > 1:
+            reply, reply_payload = jobs[0]["reply"]
+            return dict(reply, count=header["count"]), reply_payload
+        return jobs[0]["reply"]
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            job["started"] = time.time()
+            try:
+                job["reply"], job["frames"], job["points"] = self._handle(
+                    job["header"], job["payload"], job["attached"])
+                job["ok"] = True
+            except Exception as e:
+                job["reply"] = ({"ok": False, "error": f"{type(e).__name__}: {e}"}, b"")
+                job["frames"] = job["points"] = 0
+                job["ok"] = False
+            job["done"].set()
+
+    def _pipeline(self, header):
+        name = header.get("pipeline", "default")
+        if name not in self.pipelines:
+            raise KeyError(f"unknown pipeline '{name}'")
+        return self.pipelines[name]
+
+    def _canvas(self, header):
+        """Canvas for a request; a missing limit means the default, null means none."""
+        return self._pipeline(header).canvas(
+            header["frame_size"],
+            header.get("max_range_cm", canvas_layout.MAX_RANGE_CM),
+            header.get("max_pixels", canvas_layout.MAX_CANVAS_PIXELS),
+        )
+
+    def _handle(self, header, payload, attached):
+        """Returns ((reply header, reply payload), frames, points)."""
+        op = header.get("op")
+        if op == "describe":
+            layout, _, _ = self._canvas(header)
+            return ({"ok": True, "layout": layout}, b""), 0, 0
+
+        if op == "warp":
+            frame_w, frame_h = header["frame_size"]
+            layout, map1, map2 = self._canvas(header)
+            first, count = header.get("first", 0), header["count"]
+            src = attached("input", header["input_shm"])
+            dst = attached("output", header["output_shm"])
+            frames = np.ndarray((first + count, frame_h, frame_w, 3), np.uint8, buffer=src.buf)
+            canvases = np.ndarray((first + count, layout["height"], layout["width"], 3), np.uint8,
+                                  buffer=dst.buf)
+            for i in range(first, first + count):
+                cv2.remap(frames[i], map1, map2, cv2.INTER_LINEAR, dst=canvases[i])
+            return ({"ok": True, "count": count, "layout": layout}, b""), count, 0
+
+        if op == "points":
+            lut = self._pipeline(header).lookup(header["frame_size"])
+            pts = np.frombuffer(payload, np.float64).reshape(-1, 2)
+            if header.get("space", "raw") == "raw":
+                xyr, _ = lut.lookup_raw(pts)
+            else:
+                xyr, _ = lut.lookup_many(pts)
+            return ({"ok": True, "count": len(pts)}, xyr.astype(np.float32).tobytes()), 0, len(pts)
+
+        if op == "ping":
+            return ({"ok": True, "pipelines": sorted(self.pipelines)}, b""), 0, 0
+
+        raise ValueError(f"unknown op '{op}'")
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    One client connection. Its shared-memory blocks stay attached until it
+    closes, or until the client replaces a block with a new one.
+    """
+
+    def handle(self):
+        service = self.server.service
+        blocks = {}   # role -> attached block
+        lock = threading.Lock()
+
+        def attached(role, name):
+            # Requests on one connection are sequential, so a renamed block
+            # is no longer used by any running job
+            with lock:
+                shm = blocks.get(role)
+                if shm is None or shm.name != name:
+                    if shm is not None:
+                        shm.close()
+                    shm = blocks[role] = attach_shared_memory(name)
+                return shm
+
+        try:
+            while True:
+                try:
+                    header, payload = recv_message(self.request)
+                except (ConnectionError, OSError):
+                    break
+                if header.get("op") == "metrics":
+                    send_message(self.request, dict(service.metrics.snapshot(service.jobs.qsize()), ok=True))
+                    continue
+                reply, reply_payload = service.submit(header, payload, attached)
+                send_message(self.request, reply, reply_payload)
+        finally:
+            for shm in blocks.values():
+                shm.close()
+
+
+if hasattr(socket, "AF_UNIX"):
+    class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+
+def serve(service, socket_path=SOCKET_PATH):
+    """Serve until interrupted."""
+    if hasattr(socket, "AF_UNIX"):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        address = socket_path
+    else:
+        address = TCP_ADDRESS
+    # Only this user may connect: the socket is created 0o600 by bind() itself,
+    # so there is no window in which others can open it
+    old_umask = os.umask(0o177)
+    try:
+        server = _Server(address, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.service = service
+    print(f"Transform service listening on {address} "
+          f"({len(service.pipelines)} pipeline(s), {len(service._workers)} workers). Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if hasattr(socket, "AF_UNIX") and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# -----------------------------------------------------------------------------
+# Client
+# -----------------------------------------------------------------------------
+class TransformClient:
+    """Connection to a running service; reuses its shared-memory blocks between batches."""
+
+    def __init__(self, socket_path=SOCKET_PATH, pipeline="default"):
+        if hasattr(socket, "AF_UNIX"):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(socket_path)
+        else:
+            self.sock = socket.create_connection(TCP_ADDRESS)
+        self.pipeline = pipeline
+        self._blocks = {}
+        self._layouts = {}
+
+    def _call(self, header, payload=b""):
+        send_message(self.sock, dict(header, pipeline=self.pipeline), payload)
+        reply, reply_payload = recv_message(self.sock)
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error", "request failed"))
+        return reply, reply_payload
+
+    def _block(self, role, size):
+        shm = self._blocks.get(role)
+        if shm is None or shm.size < size:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            self._blocks[role] = shm
+        return shm
+
+    def describe(self, frame_size, max_range_cm=canvas_layout.MAX_RANGE_CM,
+                 max_pixels=canvas_layout.MAX_CANVAS_PIXELS):
+        """Canvas layout for a frame size; max_pixels=None renders at full resolution."""
+        key = (tuple(frame_size), max_range_cm, max_pixels)
+        if key not in self._layouts:
+            reply, _ = self._call({"op": "describe", "frame_size": list(frame_size),
+                                   "max_range_cm": max_range_cm, "max_pixels": max_pixels})
+            self._layouts[key] = reply["layout"]
+        return self._layouts[key]
+
+    def input_frames(self, count, frame_size):
+        """Shared array of count raw frames to fill before calling warp()."""
+        w, h = frame_size
+        shm = self._block("input", count * h * w * 3)
+        return np.ndarray((count, h, w, 3), np.uint8, buffer=shm.buf)
+
+    def warp(self, count, frame_size, max_range_cm=canvas_layout.MAX_RANGE_CM,
+             max_pixels=canvas_layout.MAX_CANVAS_PIXELS):
+        """Warp the first count frames of input_frames(); returns the shared canvases."""
+        layout = self.describe(frame_size, max_range_cm, max_pixels)
+        out = self._block("output", count * layout["height"] * layout["width"] * 3)
+        self._call({"op": "warp", "frame_size": list(frame_size), "count": count,
+                    "input_shm": self._blocks["input"].name, "output_shm": out.name,
+                    "max_range_cm": max_range_cm, "max_pixels": max_pixels})
+        return np.ndarray((count, layout["height"], layout["width"], 3), np.uint8, buffer=out.buf)
+
+    def points(self, points, frame_size, space="raw"):
+        """Ground (X cm, Y cm, range cm) for N pixels; NaN where there is no ground."""
+        pts = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+        _, payload = self._call({"op": "points", "frame_size": list(frame_size), "space": space},
+                                pts.tobytes())
+        return np.frombuffer(payload, np.float32).reshape(-1, 3)
+
+    def metrics(self):
+        reply, _ = self._call({"op": "metrics"})
+        return reply
+
+    def close(self):
+        for shm in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self._blocks.clear()
+        self.sock.close()
+
+
+def print_metrics(m):
+    print(f"   uptime {m['uptime_s']:.0f} s, {m['requests']} requests ({m['errors']} errors), "
+          f"{m['frames']} frames, {m['points']} points")
+    print(f"   queue depth {m['queue_depth']}, in flight {m['in_flight']}, "
+          f"mean queue wait {m['queue_wait_ms_mean']:.1f} ms")
+    print(f"   latency p50 {m['latency_ms_p50']:.1f} ms, p95 {m['latency_ms_p95']:.1f} ms, "
+          f"max {m['latency_ms_max']:.1f} ms")
+    print(f"   throughput {m['frames_per_s']:.1f} frames/s, {m['points_per_s']:.0f} points/s")
+
+
+def bench(client):
+    """Send batches of real frames and random points; print what the service reports."""
+    cap = cv2.VideoCapture(VIDEO_PATH)
+    if not cap.isOpened():
+        print(f"Error: Could not open video {VIDEO_PATH}")
+        return
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    t0 = time.time()
+    layout = client.describe(frame_size)
+    print(f"Canvas {layout['width']}x{layout['height']} ready in {time.time() - t0:.2f} s "
+          f"(fast when the service is already warm).")
+
+    frames = client.input_frames(BENCH_BATCH, frame_size)
+    batches = 0
+    t0 = time.time()
+    while True:
+        count = 0
+        while count < BENCH_BATCH and cap.read(frames[count])[0]:
+            count += 1
+        if count == 0:
+            break
+        client.warp(count, frame_size)
+        batches += 1
+    cap.release()
+    print(f"Warped {batches} batches of up to {BENCH_BATCH} frames in {time.time() - t0:.2f} s.")
+
+    rng = np.random.default_rng(0)
+    pts = rng.uniform((0, frame_size[1] / 2), frame_size, size=(BENCH_POINTS, 2))
+    t0 = time.time()
+    xyr = client.points(pts, frame_size)
+    print(f"Looked up {BENCH_POINTS} points in {(time.time() - t0) * 1000:.1f} ms "
+          f"({np.isfinite(xyr[:, 0]).mean() * 100:.0f}% on the ground).")
+
+    print("Service metrics:")
+    print_metrics(client.metrics())
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if command == "serve":
+        service = TransformService()
+        if not service.pipelines:
+            print(f"Error: none of the pipelines {sorted(PIPELINES.values())} were found. Run Step 3 first.")
+            sys.exit()
+        serve(service)
+        return
+
+    try:
+        client = TransformClient()
+    except OSError:
+        print("Error: transform service is not running (start it with 'python3 transform_service.py').")
+        sys.exit()
+    try:
+        if command == "metrics":
+            print_metrics(client.metrics())
+        elif command == "bench":
+            bench(client)
+        else:
+            print(f"Unknown command '{command}'. Use serve, metrics or bench.")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()